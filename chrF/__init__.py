@@ -13,5 +13,14 @@ __author__ = 'Stig-Arne Gronroos'
 __author_email__ = "stig-arne.gronroos@aalto.fi"
 
 from .measure import *
-from . import cmd
+
+
+def __getattr__(name):
+    # the command line modules are imported on first use,
+    # so that importing chrF for the scoring functions stays fast
+    if name == 'cmd':
+        import chrF.cmd
+        return chrF.cmd
+    raise AttributeError('module {!r} has no attribute {!r}'.format(
+        __name__, name))
 
@@ -0,0 +1,317 @@
+# -*- coding: utf-8
+"""Benchmarks of the scoring hot paths.
+
+Synthetic corpora are generated deterministically for each case
+(segment length, number of references, script, use_space).
+For each case, the throughput (sentences per second) and peak traced
+memory of ngrams_up_to, errors_n, errors_multiref and evaluate are
+measured, as well as the wall time of the command line tool.
+Results are written as JSON, and can be compared against a stored
+baseline to detect regressions.
+
+Usage:
+
+  python -m chrF.benchmark --output bench.json
+  python -m chrF.benchmark --baseline bench.json
+"""
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from . import __version__
+from . import measure
+
+LATIN = 'abcdefghijklmnopqrstuvwxyzäöüéèß'
+# a slice of the CJK unified ideographs and hiragana
+CJK = ''.join(chr(c) for c in range(0x4e00, 0x4e00 + 300)) + \
+      ''.join(chr(c) for c in range(0x3041, 0x3097))
+
+SEGMENT_WORDS = {'short': 8, 'long': 150}
+REFERENCES = (1, 4, 16)
+SCRIPTS = ('latin', 'cjk')
+
+# minimum measured time per function and case, in seconds
+MIN_TIME = 0.2
+
+
+def make_vocabulary(script, size, rng):
+    if script == 'latin':
+        return [''.join(rng.choice(LATIN)
+                        for _ in range(rng.randint(1, 9)))
+                for _ in range(size)]
+    return [''.join(rng.choice(CJK) for _ in range(rng.randint(1, 3)))
+            for _ in range(size)]
+
+
+def perturb(words, vocabulary, rng, rate=0.3):
+    """A noisy copy of a sentence: substituted, dropped and reordered words"""
+    result = []
+    for word in words:
+        roll = rng.random()
+        if roll < rate / 3:
+            continue
+        elif roll < 2 * rate / 3:
+            result.append(rng.choice(vocabulary))
+        else:
+            result.append(word)
+    if len(result) > 2 and rng.random() < rate:
+        i = rng.randrange(len(result) - 1)
+        result[i], result[i + 1] = result[i + 1], result[i]
+    return result
+
+
+def make_corpus(n_sentences, n_words, n_refs, script, seed=0):
+    """Deterministic synthetic hypotheses and references"""
+    rng = random.Random('{}-{}-{}-{}-{}'.format(
+        seed, n_sentences, n_words, n_refs, script))
+    vocabulary = make_vocabulary(script, 2000, rng)
+    sep = ' ' if script == 'latin' else ''
+    hyps = []
+    refs = []
+    for _ in range(n_sentences):
+        length = max(1, int(rng.gauss(n_words, n_words / 4)))
+        source = [rng.choice(vocabulary) for _ in range(length)]
+        hyps.append(sep.join(perturb(source, vocabulary, rng)))
+        refs.append([sep.join(perturb(source, vocabulary, rng))
+                     for _ in range(n_refs)])
+    return hyps, refs
+
+
+def cases(quick=False):
+    lengths = ('short', 'long')
+    references = (1, 4) if quick else REFERENCES
+    for (length, n_refs, script, use_space) in itertools.product(
+            lengths, references, SCRIPTS, (True, False)):
+        if script == 'cjk' and not use_space:
+            # no spaces to ignore
+            continue
+        yield (length, n_refs, script, use_space)
+
+
+def case_name(case):
+    length, n_refs, script, use_space = case
+    return '{}-{}ref-{}-{}'.format(
+        length, n_refs, script, 'space' if use_space else 'nospace')
+
+
+def hot_paths(hyps, refs, max_n, use_space):
+    """(name, function) pairs. Each function processes all sentences."""
+    hyp_ngrams = [measure.ngrams_up_to(hyp, max_n, use_space=use_space)
+                  for hyp in hyps]
+    ref_ngrams = [measure.ngrams_up_to(ref[0], max_n, use_space=use_space)
+                  for ref in refs]
+
+    def ngrams_up_to():
+        for hyp in hyps:
+            measure.ngrams_up_to(hyp, max_n, use_space=use_space)
+
+    def errors_n():
+        for (hyp, ref) in zip(hyp_ngrams, ref_ngrams):
+            for i in range(max_n):
+                measure.errors_n(hyp[i], ref[i])
+
+    def errors_multiref():
+        for (hyp, ref) in zip(hyps, refs):
+            for _ in measure.errors_multiref(hyp, ref, max_n,
+                                             use_space=use_space):
+                pass
+
+    def evaluate():
+        with contextlib.redirect_stdout(io.StringIO()):
+            measure.evaluate(hyps, refs, max_n, use_space=use_space)
+
+    return [('ngrams_up_to', ngrams_up_to),
+            ('errors_n', errors_n),
+            ('errors_multiref', errors_multiref),
+            ('evaluate', evaluate)]
+
+
+def measure_speed(func, n_sentences):
+    """Sentences per second, best of repeated runs"""
+    best = None
+    total = 0.
+    while total < MIN_TIME or best is None:
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        total += elapsed
+        if best is None or elapsed < best:
+            best = elapsed
+    return n_sentences / best if best > 0 else float('inf')
+
+
+def measure_memory(func):
+    """Peak traced memory during a run, in KiB"""
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak / 1024.
+
+
+def measure_cli(hyps, refs, max_n, use_space, tmp_dir):
+    """Wall time of a run of the command line tool, in seconds"""
+    hyp_path = os.path.join(tmp_dir, 'hyp.txt')
+    ref_path = os.path.join(tmp_dir, 'ref.txt')
+    with open(hyp_path, 'w') as fobj:
+        fobj.writelines(hyp + '\n' for hyp in hyps)
+    with open(ref_path, 'w') as fobj:
+        fobj.writelines('*#'.join(ref) + '\n' for ref in refs)
+    command = [sys.executable, '-c',
+               'import sys; from chrF import cmd; cmd.run(sys.argv[1:])',
+               '-n', str(max_n), hyp_path, ref_path]
+    if not use_space:
+        command.append('--ignore-space')
+    env = dict(os.environ)
+    package_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env['PYTHONPATH'] = os.pathsep.join(
+        [package_root] + [p for p in [env.get('PYTHONPATH')] if p])
+    start = time.perf_counter()
+    subprocess.check_call(command, stdout=subprocess.DEVNULL, env=env)
+    return time.perf_counter() - start
+
+
+def run(n_sentences=200, max_n=6, quick=False, cli=True, seed=0,
+        log=None):
+    """Runs all cases. Returns the results as a JSON-serializable dict."""
+    results = {}
+    tmp_dir = tempfile.mkdtemp(prefix='chrF-bench-')
+    try:
+        for case in cases(quick=quick):
+            length, n_refs, script, use_space = case
+            name = case_name(case)
+            hyps, refs = make_corpus(n_sentences, SEGMENT_WORDS[length],
+                                     n_refs, script, seed=seed)
+            case_results = {}
+            for (func_name, func) in hot_paths(hyps, refs, max_n,
+                                               use_space):
+                case_results[func_name] = {
+                    'sentences_per_sec': measure_speed(func, n_sentences),
+                    'peak_kib': measure_memory(func),
+                }
+            if cli:
+                case_results['cli'] = {
+                    'seconds': measure_cli(hyps, refs, max_n,
+                                           use_space, tmp_dir),
+                }
+            results[name] = case_results
+            if log is not None:
+                log.write('{}\t{}\n'.format(name, ' '.join(
+                    '{}={:.0f}/s'.format(func_name,
+                                         values['sentences_per_sec'])
+                    for (func_name, values) in sorted(case_results.items())
+                    if 'sentences_per_sec' in values)))
+    finally:
+        shutil.rmtree(tmp_dir)
+    return {
+        'meta': {
+            'chrF': __version__,
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'machine': platform.machine(),
+            'n_sentences': n_sentences,
+            'max_n': max_n,
+            'seed': seed,
+        },
+        'results': results,
+    }
+
+
+# metric: True if higher is better
+METRICS = {
+    'sentences_per_sec': True,
+    'peak_kib': False,
+    'seconds': False,
+}
+
+
+def compare(current, baseline, threshold=0.1):
+    """Yields (case, function, metric, baseline, current, ratio, regressed)
+    for each metric present in both results."""
+    for (case, funcs) in sorted(current['results'].items()):
+        base_funcs = baseline['results'].get(case, {})
+        for (func_name, values) in sorted(funcs.items()):
+            base_values = base_funcs.get(func_name, {})
+            for (metric, value) in sorted(values.items()):
+                if metric not in base_values:
+                    continue
+                base = base_values[metric]
+                ratio = value / base if base else float('inf')
+                if METRICS[metric]:
+                    regressed = ratio < 1 - threshold
+                else:
+                    regressed = ratio > 1 + threshold
+                yield (case, func_name, metric, base, value,
+                       ratio, regressed)
+
+
+def get_argparser():
+    parser = argparse.ArgumentParser(
+        prog='chrF benchmark',
+        description='Benchmarks of the chrF scoring hot paths.')
+    add_arg = parser.add_argument
+    add_arg('--output', default=None, metavar='FILE',
+            help='Write the results as JSON to FILE.')
+    add_arg('--baseline', default=None, metavar='FILE',
+            help='Compare against the results stored in FILE. '
+                 'Exits with status 1 if any metric regressed.')
+    add_arg('--threshold', type=float, default=0.1,
+            help='Relative change counted as a regression '
+                 '(default %(default)s).')
+    add_arg('--sentences', type=int, default=200,
+            help='Sentences per synthetic corpus (default %(default)s).')
+    add_arg('-n', '--order', type=int, default=6,
+            help='ngram order (default %(default)s).')
+    add_arg('--seed', type=int, default=0,
+            help='Seed of the synthetic corpora (default %(default)s).')
+    add_arg('--quick', default=False, action='store_true',
+            help='Run a reduced set of cases.')
+    add_arg('--no-cli', dest='cli', default=True, action='store_false',
+            help='Do not benchmark the command line tool.')
+    return parser
+
+
+def benchmark_main(args):
+    results = run(n_sentences=args.sentences,
+                  max_n=args.order,
+                  quick=args.quick,
+                  cli=args.cli,
+                  seed=args.seed,
+                  log=sys.stderr)
+    if args.output is not None:
+        with open(args.output, 'w') as fobj:
+            json.dump(results, fobj, indent=2, sort_keys=True)
+    else:
+        json.dump(results, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+
+    if args.baseline is not None:
+        with open(args.baseline, 'r') as fobj:
+            baseline = json.load(fobj)
+        regressions = 0
+        for row in compare(results, baseline, threshold=args.threshold):
+            case, func_name, metric, base, value, ratio, regressed = row
+            if regressed:
+                regressions += 1
+            sys.stderr.write('{}\t{}\t{}\t{:.4g}\t{:.4g}\t{:.3f}{}\n'.format(
+                case, func_name, metric, base, value, ratio,
+                '\tREGRESSION' if regressed else ''))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    benchmark_main(get_argparser().parse_args())
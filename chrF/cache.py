@@ -0,0 +1,185 @@
+# -*- coding: utf-8
+"""A cache of segment statistics"""
+import array
+import collections
+import hashlib
+import os
+import sqlite3
+import sys
+import time
+
+from .measure import ReferenceProfile, evaluate_chunk
+from .statsfile import FIELDS, TYPECODE, stats_from_record
+
+# bump when the counting of the cached statistics changes
+CACHE_VERSION = 2
+
+
+def segment_key(hypothesis, references, max_n, use_space=True):
+    """Hash of a segment and the counting parameters"""
+    if isinstance(references, ReferenceProfile):
+        references = references.references
+    return hashlib.sha1(repr(
+        (CACHE_VERSION, max_n, bool(use_space), hypothesis,
+         tuple(references))).encode('utf-8')).digest()
+
+
+def stats_to_record(stats):
+    record = array.array(TYPECODE)
+    for field in FIELDS:
+        record.extend(int(x) for x in getattr(stats, field))
+    return record
+
+
+def little_endian(record):
+    if sys.byteorder == 'big':
+        record = array.array(TYPECODE, record)
+        record.byteswap()
+    return record.tobytes()
+
+
+class SegmentCache(object):
+    """Per-order counts of (hypothesis, references) pairs.
+
+    Lookups go to an in-memory LRU tier first, then to an SQLite
+    database on disk (if a directory is given). Computed counts are
+    added to both. When closed, the least recently used entries
+    beyond disk_size are evicted from the database.
+    Missing n-grams are not stored, so the cache can not be used
+    to show them. The counts are stored as in statsfile."""
+    # entries added or touched before each write to the database
+    WRITE_BATCH = 10000
+    # keys per SELECT
+    LOOKUP_BATCH = 500
+
+    def __init__(self, cache_dir=None, memory_size=100000,
+                 disk_size=10 ** 7):
+        self.memory = collections.OrderedDict()
+        self.memory_size = memory_size
+        self.disk_size = disk_size
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.inserts = []
+        self.touched = []
+        self.db = None
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            self.db = sqlite3.connect(
+                os.path.join(cache_dir, 'segments.sqlite'))
+            self.db.execute('CREATE TABLE IF NOT EXISTS segments '
+                            '(key BLOB PRIMARY KEY, counts BLOB, used REAL)')
+            self.db.execute('CREATE INDEX IF NOT EXISTS segments_used '
+                            'ON segments (used)')
+
+    def remember(self, key, record):
+        self.memory[key] = record
+        self.memory.move_to_end(key)
+        if len(self.memory) > self.memory_size:
+            self.memory.popitem(last=False)
+
+    def lookup(self, keys):
+        """Records of those keys that are cached"""
+        found = {}
+        on_disk = collections.Counter()
+        for key in keys:
+            record = self.memory.get(key)
+            if record is not None:
+                self.memory.move_to_end(key)
+                found[key] = record
+                self.memory_hits += 1
+            elif self.db is not None:
+                on_disk[key] += 1
+        on_disk_keys = list(on_disk)
+        for start in range(0, len(on_disk_keys), self.LOOKUP_BATCH):
+            batch = on_disk_keys[start:start + self.LOOKUP_BATCH]
+            rows = self.db.execute(
+                'SELECT key, counts FROM segments WHERE key IN ({})'.format(
+                    ','.join('?' * len(batch))), batch)
+            for (key, counts) in rows:
+                record = array.array(TYPECODE)
+                record.frombytes(counts)
+                if sys.byteorder == 'big':
+                    record.byteswap()
+                found[key] = record
+                self.remember(key, record)
+                self.touched.append(key)
+                self.disk_hits += on_disk[key]
+        if len(self.touched) >= self.WRITE_BATCH:
+            self.flush()
+        return found
+
+    def store(self, key, record):
+        self.remember(key, record)
+        if self.db is not None:
+            self.inserts.append((key, record))
+            if len(self.inserts) >= self.WRITE_BATCH:
+                self.flush()
+
+    def evaluate_chunk(self, chunk, max_n, factor, use_space=True,
+                       engine='python'):
+        """Stats of each (hypothesis, references) pair of a chunk.
+        Only the pairs not found in the cache are evaluated,
+        repeated pairs only once."""
+        keys = [segment_key(hyp, refs, max_n, use_space=use_space)
+                for (hyp, refs) in chunk]
+        found = self.lookup(keys)
+        todo = collections.OrderedDict()
+        for (key, pair) in zip(keys, chunk):
+            if key not in found and key not in todo:
+                todo[key] = pair
+        self.misses += len(todo)
+        self.memory_hits += sum(1 for key in keys if key not in found) \
+            - len(todo)
+        if todo:
+            _, computed = evaluate_chunk(list(todo.values()), max_n, factor,
+                                         use_space, keep_sentences=True,
+                                         engine=engine)
+            for (key, stats) in zip(todo, computed):
+                found[key] = stats_to_record(stats)
+                self.store(key, found[key])
+        return [stats_from_record(found[key], max_n) for key in keys]
+
+    def evaluate_single(self, hypothesis, references, max_n, factor=None,
+                        use_space=True):
+        return self.evaluate_chunk([(hypothesis, references)], max_n,
+                                   factor, use_space=use_space)[0]
+
+    def flush(self):
+        if self.db is None:
+            return
+        now = time.time()
+        self.db.executemany(
+            'INSERT OR REPLACE INTO segments VALUES (?, ?, ?)',
+            ((key, little_endian(record), now)
+             for (key, record) in self.inserts))
+        self.db.executemany(
+            'UPDATE segments SET used = ? WHERE key = ?',
+            ((now, key) for key in self.touched))
+        self.db.commit()
+        self.inserts = []
+        self.touched = []
+
+    def evict(self):
+        """Removes the least recently used entries beyond disk_size"""
+        (count,) = self.db.execute('SELECT COUNT(*) FROM segments').fetchone()
+        if count > self.disk_size:
+            self.db.execute(
+                'DELETE FROM segments WHERE key IN '
+                '(SELECT key FROM segments ORDER BY used LIMIT ?)',
+                (count - self.disk_size,))
+            self.db.commit()
+
+    def close(self):
+        if self.db is not None:
+            self.flush()
+            self.evict()
+            self.db.close()
+            self.db = None
+
+    def report(self, stream=None):
+        stream = sys.stderr if stream is None else stream
+        stream.write('chrF: segment cache: {} hits ({} memory, {} disk), '
+                     '{} misses\n'.format(self.memory_hits + self.disk_hits,
+                                          self.memory_hits, self.disk_hits,
+                                          self.misses))
@@ -1,11 +1,18 @@
 # -*- coding: utf-8
 import sys
-import argparse
 
-from .measure import evaluate
+from .measure import (
+    evaluate, evaluate_systems, evaluate_nbest, report, ENGINES)
+from .output import FORMATS, get_writer
+# the input readers, statistics files, segment cache, profiler and
+# stdin worker are imported when used, to keep the startup of short runs fast
 
 def get_argparser():
+    import argparse
     parser = argparse.ArgumentParser(
+        usage='%(prog)s [options] hypothesis [hypothesis ...] reference\n'
+              '       %(prog)s [options] --from-stats FILE\n'
+              '       %(prog)s [options] --server-stdin',
         description="""
 chrF 1.0.0
 
@@ -44,13 +51,45 @@ Simple usage example:
 
   %(prog)s -b 2.0 hyp.txt ref.txt > score
 
+Comparing several systems:
+
+  %(prog)s sys1.txt sys2.txt sys3.txt ref.txt > scores
+
+Significance of the difference between two systems:
+
+  %(prog)s significance sys1.txt sys2.txt ref.txt
+
+Scores for several values of beta and the n-gram order:
+
+  %(prog)s sweep --betas 0.5,1,2 --orders 1-6 hyp.txt ref.txt
+
+Resident worker for tuning, scoring "hypothesis<TAB>references" lines:
+
+  %(prog)s --server-stdin -b 2.0
+
+Sharded evaluation, merging the corpus statistics of the parts:
+
+  %(prog)s --shard-out part1.shard hyp1.txt ref1.txt
+  %(prog)s --shard-out part2.shard --shard-offset 5000 hyp2.txt ref2.txt
+  %(prog)s merge part1.shard part2.shard
+
+Scoring server, keeping the references in memory:
+
+  %(prog)s serve --socket /tmp/chrF.sock --register test=ref.txt
+
 """,
         formatter_class=argparse.RawDescriptionHelpFormatter)
 
     add_arg = parser.add_argument
-    add_arg('hypothesis', help='Plain-text hypothesis file')
-    add_arg('reference',
-        help='Reference file. '
+    # the reference is split off the end of the hypotheses by parse_args
+    add_arg('hypothesis', nargs='*',
+        help='Plain-text hypothesis file, '
+             'optionally compressed with gzip, bzip2 or xz, '
+             'or "-" for stdin. '
+             'Several systems can be given, '
+             'and are scored in a single pass')
+    add_arg('reference', nargs='?',
+        help='Reference file, compressed or "-" like the hypothesis. '
              'Can contain multiple alternatives, '
              'split by --reference-separator')
     
@@ -73,6 +112,47 @@ Simple usage example:
             default='*#', metavar='SEP',
             help='Separator for multiple references '
                  '(default "%(default)s").')
+    add_arg('--from-stats', default=None, metavar='FILE',
+            help='Score the sentence statistics stored with --emit-stats, '
+                 'instead of text input. '
+                 'The ngram order is taken from the file.')
+    add_arg('--nbest', default=False, action='store_true',
+            help='The hypothesis file is a Moses n-best list '
+                 '("id ||| hypothesis ||| ..."). The score of each '
+                 'candidate is shown, and the summary is of the first '
+                 'candidate of each id.')
+    add_arg('--server-stdin', default=False, action='store_true',
+            help='Stay resident, reading "hypothesis<TAB>references" '
+                 'lines from stdin and writing the sentence chrF '
+                 'of each line to stdout as soon as it is read.')
+
+    add_arg = parser.add_argument_group(
+        'runtime options').add_argument
+    add_arg('-j', '--jobs', type=int, default=1,
+            help='Number of worker processes used for scoring '
+                 '(default %(default)s).')
+    add_arg('--engine', default='python', choices=ENGINES,
+            help='Implementation of n-gram counting and matching. '
+                 'The numpy engine scores about 3 times as many sentences '
+                 'per second (less with many references, as sorting the '
+                 'n-grams of each order dominates), '
+                 'but can not show missing ngrams '
+                 '(default %(default)s).')
+    add_arg('--segment-cache', default=None, metavar='DIR',
+            help='Cache the statistics of each segment in DIR, '
+                 'to skip scoring the same hypothesis and references '
+                 'again in this or later runs. Not used with '
+                 '--show-missing. Scored in a single process, '
+                 'without --jobs.')
+    add_arg('--segment-cache-size', type=int, default=10 ** 7,
+            metavar='N',
+            help='Number of segments kept in the cache '
+                 '(default %(default)s).')
+    add_arg('--progress', default=False, action='store_true',
+            help='Periodically report progress on stderr.')
+    add_arg('--profile', default=None, metavar='FILE',
+            help='Write the time spent in each phase of scoring '
+                 'as JSON to FILE.')
 
     add_arg = parser.add_argument_group(
         'output options').add_argument
@@ -84,35 +164,341 @@ Simple usage example:
     add_arg('--show-sentence', dest='sent_level',
             default=False, action='store_true',
             help='Show sentence level scores.')
+    add_arg('--show-document', dest='doc_level',
+            default=False, action='store_true',
+            help='Show document level scores (chrF_sgm only).')
     add_arg('--show-missing', dest='missing',
             default=False, action='store_true',
             help='Show ngrams without a match. '
                  'Requires --show-sentence.')
     add_arg('--compatible', default=False, action='store_true',
             help='Produce backwards compatible output.')
+    add_arg('--emit-stats', default=None, metavar='FILE',
+            help='Store the sentence statistics in binary FILE, '
+                 'for rescoring with --from-stats.')
+    add_arg('--shard-out', default=None, metavar='FILE',
+            help='Store the corpus statistics in FILE, '
+                 'to be combined with those of other parts of the corpus '
+                 'by "chrF merge".')
+    add_arg('--shard-offset', type=int, default=None, metavar='N',
+            help='Line number of the first sentence of this part '
+                 'in the whole corpus, stored in the --shard-out file. '
+                 'Used by "chrF merge" to detect overlapping parts.')
+    add_arg('--raw-counts', default=False, action='store_true',
+            help='With --server-stdin, write the n-gram statistics '
+                 'of each line instead of its chrF.')
+    add_arg('--output-format', default='text', choices=FORMATS,
+            help='Write one record per sentence (with --show-sentence) '
+                 'and for the corpus, holding all n-gram level scores '
+                 '(default %(default)s).')
 
     return parser
 
+# name: (module, parser function, main function)
+SUBCOMMANDS = {
+    'significance': ('significance', 'get_argparser', 'significance_main'),
+    'benchmark': ('benchmark', 'get_argparser', 'benchmark_main'),
+    'serve': ('server', 'get_argparser', 'serve_main'),
+    'sweep': ('sweep', 'get_argparser', 'sweep_main'),
+    'merge': ('merge', 'get_argparser', 'merge_main'),
+}
+
+def run(argv):
+    """Entry point of the chrF script.
+    If the first argument names a subcommand, the rest of the
+    arguments are passed to it, otherwise they are scored with main."""
+    if argv and argv[0] in SUBCOMMANDS:
+        import importlib
+        module_name, parser_name, main_name = SUBCOMMANDS[argv[0]]
+        module = importlib.import_module('.' + module_name, __package__)
+        parser = getattr(module, parser_name)()
+        args = parser.parse_args(argv[1:])
+        return getattr(module, main_name)(args)
+    args = plain_args(argv)
+    if args is None:
+        args = parse_args(argv)
+    return main(args)
+
+# parse_args of a command line of only input files,
+# or of only --server-stdin (see plain_args)
+PLAIN_DEFAULTS = {
+    'order': 6, 'nweight': None, 'beta': 1.0, 'ignore_space': False,
+    'refsep': '*#', 'from_stats': None, 'nbest': False,
+    'server_stdin': False, 'jobs': 1, 'engine': 'python',
+    'segment_cache': None, 'segment_cache_size': 10 ** 7,
+    'progress': False, 'profile': None, 'hide_precrec': False,
+    'ngram_level': False, 'sent_level': False, 'doc_level': False,
+    'missing': False, 'compatible': False, 'emit_stats': None,
+    'shard_out': None, 'shard_offset': None, 'raw_counts': False,
+    'output_format': 'text', 'hypothesis': [], 'reference': None,
+}
+
+class PlainArgs(object):
+    """Parsed arguments, as the argparse.Namespace of parse_args"""
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+def plain_args(argv):
+    """The arguments parse_args would return for a command line
+    without options, or with only --server-stdin, or None for any
+    other command line. Importing argparse and building the parser
+    take a third of the startup of a short run."""
+    if argv == ['--server-stdin']:
+        return PlainArgs(**dict(PLAIN_DEFAULTS, server_stdin=True))
+    if len(argv) < 2 or any(arg.startswith('-') for arg in argv):
+        return None
+    return PlainArgs(**dict(PLAIN_DEFAULTS,
+                            hypothesis=argv[:-1], reference=argv[-1]))
+
+def parse_args(argv, parser=None):
+    """Parses the command line, in which options and input files can be
+    mixed, splitting the reference off the end of the hypothesis files."""
+    if parser is None:
+        parser = get_argparser()
+    args = parser.parse_intermixed_args(argv)
+    if args.reference is None and args.hypothesis:
+        args.reference = args.hypothesis.pop()
+    if args.server_stdin:
+        if args.hypothesis or args.reference is not None \
+                or args.from_stats is not None:
+            parser.error('--server-stdin does not take input files')
+        return args
+    if args.raw_counts:
+        parser.error('--raw-counts requires --server-stdin')
+    if args.from_stats is None:
+        if not args.hypothesis or args.reference is None:
+            parser.error('a hypothesis and a reference file are required')
+    elif args.hypothesis or args.reference is not None:
+        parser.error('--from-stats does not take input files')
+    if (args.hypothesis + [args.reference]).count('-') > 1:
+        parser.error('only one input file can be read from stdin')
+    if args.emit_stats is not None and len(args.hypothesis) > 1:
+        parser.error('--emit-stats takes a single hypothesis file')
+    if args.shard_out is not None:
+        if len(args.hypothesis) != 1 or args.nbest:
+            parser.error('--shard-out takes a single hypothesis file')
+    elif args.shard_offset is not None:
+        parser.error('--shard-offset requires --shard-out')
+    if args.segment_cache is not None and args.jobs > 1:
+        parser.error('--segment-cache is used in a single process, '
+                     'without --jobs')
+    if args.output_format == 'tsv' and args.missing:
+        parser.error('--show-missing can not be combined with tsv output')
+    if args.nbest:
+        if len(args.hypothesis) != 1:
+            parser.error('--nbest takes a single n-best list')
+        if args.missing or args.emit_stats is not None:
+            parser.error('--nbest can not be combined with '
+                         '--show-missing or --emit-stats')
+        if args.jobs > 1:
+            parser.error('--nbest is scored in a single process, '
+                         'without --jobs')
+    return args
+
 def main(args):
     if args.nweight is None:
         ngram_weights = None
     else:
         ngram_weights = args.nweight.split(',')
 
-    with open(args.hypothesis, 'r') as hyp_lines:
-        with open(args.reference, 'r') as ref_lines:
-            hyp_lines = (line.strip() for line in hyp_lines)
-            ref_lines = (line.strip().split(args.refsep)
-                         for line in ref_lines)
-            stats = evaluate(
-                hyp_lines,
-                ref_lines,
-                max_n=args.order,
-                beta=args.beta,
-                ngram_weights=ngram_weights,
-                use_space=not args.ignore_space,
-                hide_precrec=args.hide_precrec,
-                print_missing=args.missing,
-                sentence_level=args.sent_level,
-                ngram_level=args.ngram_level,
-                compatible=args.compatible)
+    if args.from_stats is not None:
+        return main_from_stats(args, ngram_weights)
+    if args.server_stdin:
+        from .worker import serve_stdin
+        return serve_stdin(args.order,
+                           beta=args.beta,
+                           ngram_weights=ngram_weights,
+                           use_space=not args.ignore_space,
+                           refsep=args.refsep,
+                           raw_counts=args.raw_counts)
+
+    profiler = get_profiler(args)
+    if args.nbest:
+        return main_nbest(args, ngram_weights, profiler)
+    from .inputs import read_lines
+    hyp_files = [read_lines(path)
+                 for path in args.hypothesis]
+    ref_lines = open_references(args)
+    if profiler is not None:
+        hyp_files = [profiler.timed_iter('input', lines)
+                     for lines in hyp_files]
+        ref_lines = profiler.timed_iter('input', ref_lines)
+    writer = make_writer(args, args.order, ngram_weights,
+                         systems=len(hyp_files) > 1)
+    segment_cache = make_segment_cache(args)
+    with instrumented(profiler):
+        evaluate_files(args, hyp_files, ref_lines, ngram_weights,
+                       profiler, writer, segment_cache)
+        if writer is not None:
+            writer.close()
+    close_segment_cache(segment_cache)
+    finish_profiler(args, profiler)
+
+def evaluate_files(args, hyp_files, ref_lines, ngram_weights,
+                   profiler=None, writer=None, segment_cache=None):
+    if len(hyp_files) == 1:
+        if args.emit_stats is None:
+            emit_stats = None
+        else:
+            from .statsfile import StatsWriter
+            emit_stats = StatsWriter(open(args.emit_stats, 'wb'),
+                                     args.order,
+                                     use_space=not args.ignore_space)
+        hyp_lines = CountedLines(hyp_files[0])
+        stats = evaluate(
+            hyp_lines,
+            ref_lines,
+            max_n=args.order,
+            beta=args.beta,
+            ngram_weights=ngram_weights,
+            use_space=not args.ignore_space,
+            hide_precrec=args.hide_precrec,
+            print_missing=args.missing,
+            sentence_level=args.sent_level,
+            ngram_level=args.ngram_level,
+            compatible=args.compatible,
+            jobs=args.jobs,
+            engine=args.engine,
+            emit_stats=emit_stats,
+            profiler=profiler,
+            writer=writer,
+            segment_cache=segment_cache)
+        if emit_stats is not None:
+            emit_stats.close()
+        if args.shard_out is not None:
+            from .statsfile import write_shard
+            with open(args.shard_out, 'w') as fobj:
+                write_shard(fobj, stats, hyp_lines.count,
+                            use_space=not args.ignore_space,
+                            first_line=args.shard_offset)
+    else:
+        stats = evaluate_systems(
+            hyp_files,
+            ref_lines,
+            max_n=args.order,
+            beta=args.beta,
+            ngram_weights=ngram_weights,
+            use_space=not args.ignore_space,
+            hide_precrec=args.hide_precrec,
+            print_missing=args.missing,
+            sentence_level=args.sent_level,
+            ngram_level=args.ngram_level,
+            compatible=args.compatible,
+            names=args.hypothesis,
+            jobs=args.jobs,
+            engine=args.engine,
+            profiler=profiler,
+            writer=writer,
+            segment_cache=segment_cache)
+
+class CountedLines(object):
+    """Iterates over lines, counting them"""
+    def __init__(self, lines):
+        self.lines = lines
+        self.count = 0
+
+    def __iter__(self):
+        for line in self.lines:
+            self.count += 1
+            yield line
+
+def open_references(args):
+    from .inputs import read_references
+    return read_references(args.reference, refsep=args.refsep)
+
+def main_nbest(args, ngram_weights, profiler=None):
+    from .inputs import read_nbest
+    nbest = read_nbest(args.hypothesis[0])
+    ref_lines = open_references(args)
+    writer = make_writer(args, args.order, ngram_weights)
+    with instrumented(profiler):
+        evaluate_nbest(
+            nbest,
+            ref_lines,
+            max_n=args.order,
+            beta=args.beta,
+            ngram_weights=ngram_weights,
+            use_space=not args.ignore_space,
+            hide_precrec=args.hide_precrec,
+            ngram_level=args.ngram_level,
+            engine=args.engine,
+            profiler=profiler,
+            writer=writer)
+        if writer is not None:
+            writer.close()
+    finish_profiler(args, profiler)
+
+def make_writer(args, max_n, ngram_weights, systems=False):
+    """A writer for --output-format, or None for text output"""
+    return get_writer(args.output_format, max_n, args.beta,
+                      ngram_weights=ngram_weights,
+                      systems=systems,
+                      missing=args.missing)
+
+def make_segment_cache(args):
+    if args.segment_cache is None or args.missing:
+        return None
+    from .cache import SegmentCache
+    return SegmentCache(args.segment_cache,
+                        disk_size=args.segment_cache_size)
+
+def close_segment_cache(segment_cache):
+    if segment_cache is not None:
+        segment_cache.close()
+        segment_cache.report()
+
+def get_profiler(args, count_total=True):
+    """A Profiler if requested by --progress or --profile, otherwise None.
+    With count_total, the hypothesis lines are counted for the ETA,
+    unless that takes another pass over stdin, a pipe or a compressed file."""
+    if not args.progress and args.profile is None:
+        return None
+    from .profiling import Profiler, count_lines
+    from .inputs import is_plain_file
+    total = None
+    if count_total and args.progress \
+            and all(is_plain_file(path) for path in args.hypothesis):
+        total = count_lines(args.hypothesis[0]) * len(args.hypothesis)
+    return Profiler(progress=args.progress, total=total)
+
+class Uninstrumented(object):
+    """Context of runs without a profiler,
+    as contextlib is not imported at startup"""
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exc_info):
+        return False
+
+def instrumented(profiler):
+    if profiler is None:
+        return Uninstrumented()
+    return profiler.instrument()
+
+def finish_profiler(args, profiler):
+    if profiler is None:
+        return
+    if args.progress:
+        profiler.report_progress()
+    if args.profile is not None:
+        profiler.write(args.profile)
+
+def main_from_stats(args, ngram_weights):
+    from .statsfile import read_header, iter_stats
+    with open(args.from_stats, 'rb') as fobj:
+        max_n, _ = read_header(fobj)
+        writer = make_writer(args, max_n, ngram_weights)
+        sentences = ((None, [sent_stats])
+                     for sent_stats in iter_stats(fobj, max_n))
+        stats = report(
+            sentences,
+            max_n,
+            beta=args.beta,
+            ngram_weights=ngram_weights,
+            hide_precrec=args.hide_precrec,
+            sentence_level=args.sent_level,
+            ngram_level=args.ngram_level,
+            compatible=args.compatible,
+            writer=writer)
+    if writer is not None:
+        writer.close()
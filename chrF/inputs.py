@@ -0,0 +1,243 @@
+# -*- coding: utf-8
+"""Reading of the input files.
+
+Plain files are read by text file iteration. They can also be memory
+mapped and decoded in large blocks, which are split into lines at once
+(use_mmap), but that was measured to be about as fast, reading taking
+little of the scoring time either way.
+Blocks always end at a newline, so multibyte characters are never split.
+Unlike text mode iteration, a lone carriage return is not a line break.
+
+Each file is opened once. Files compressed with gzip, bzip2 or xz are
+recognized by their magic bytes, which are peeked without consuming them,
+so that pipes and process substitutions can be read. The path "-" reads
+stdin. Compressed files, pipes and stdin are decompressed, decoded and
+split into lines in the same blocks, by a background thread feeding
+a bounded queue, so that reading overlaps with scoring.
+"""
+import io
+import itertools
+import os
+import stat
+import sys
+# threading, mmap, locale and the decompressors are imported when used,
+# to keep the startup of short runs fast
+
+# bytes decoded at a time from a memory mapped file or a stream
+BLOCK_SIZE = 1 << 20
+
+# blocks of lines queued by a reader thread
+QUEUE_BLOCKS = 8
+
+# magic bytes: module with an open function for the format
+COMPRESSION = (
+    (b'\x1f\x8b', 'gzip'),
+    (b'BZh', 'bz2'),
+    (b'\xfd7zXZ\x00', 'lzma'),
+)
+
+
+def open_input(path):
+    """(fobj, module): the binary stream of a file, and the module
+    decompressing it, or None if it is not compressed.
+    "-" is stdin."""
+    fobj = sys.stdin.buffer if path == '-' else open(path, 'rb')
+    return (fobj, compression(fobj))
+
+
+def compression(fobj):
+    """The module decompressing a binary stream, or None if not
+    compressed. The first bytes are peeked, not consumed."""
+    head = fobj.peek(6)[:6]
+    for (magic, module_name) in COMPRESSION:
+        if head.startswith(magic):
+            import importlib
+            return importlib.import_module(module_name)
+    return None
+
+
+def is_regular(fobj):
+    """False for stdin, pipes and other streams that can not be
+    memory mapped or read again"""
+    return stat.S_ISREG(os.fstat(fobj.fileno()).st_mode)
+
+
+def is_plain_file(path):
+    """True for a regular file that is not compressed, which can be
+    read again cheaply"""
+    if path == '-' or not stat.S_ISREG(os.stat(path).st_mode):
+        return False
+    with open(path, 'rb') as fobj:
+        return compression(fobj) is None
+
+
+def text_lines(fobj):
+    """Yields the stripped lines of an uncompressed regular file"""
+    with io.TextIOWrapper(fobj) as lines:
+        for line in lines:
+            yield line.strip()
+
+
+def mmap_blocks(fobj, block_size=BLOCK_SIZE):
+    """Yields blocks of bytes of a regular file, each ending at a newline
+    (except possibly the last)"""
+    import mmap
+    with fobj:
+        size = os.fstat(fobj.fileno()).st_size
+        if size == 0:
+            return
+        with mmap.mmap(fobj.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            start = 0
+            while start < size:
+                end = min(start + block_size, size)
+                if end < size:
+                    newline = mapped.rfind(b'\n', start, end)
+                    if newline == -1:
+                        # a line longer than the block
+                        newline = mapped.find(b'\n', end)
+                    if newline == -1:
+                        end = size
+                    else:
+                        end = newline + 1
+                yield mapped[start:end]
+                start = end
+
+
+def stream_blocks(fobj, block_size=BLOCK_SIZE):
+    """Yields blocks of bytes of a stream, each ending at a newline
+    (except possibly the last)"""
+    rest = b''
+    for block in iter(lambda: fobj.read(block_size), b''):
+        block = rest + block
+        newline = block.rfind(b'\n')
+        if newline == -1:
+            rest = block
+            continue
+        rest = block[newline + 1:]
+        yield block[:newline + 1]
+    if rest:
+        yield rest
+
+
+def split_block(text):
+    """The stripped lines of a decoded block"""
+    lines = text.split('\n')
+    if lines[-1] == '':
+        # the block ended in a newline
+        lines.pop()
+    return [line.strip() for line in lines]
+
+
+def mmap_line_batches(fobj, block_size=BLOCK_SIZE, encoding=None):
+    """Yields lists of the stripped lines of a file, one list per block"""
+    if encoding is None:
+        import locale
+        encoding = locale.getpreferredencoding(False)
+    for block in mmap_blocks(fobj, block_size=block_size):
+        yield split_block(block.decode(encoding))
+
+
+def stream_line_batches(fobj, module=None, block_size=BLOCK_SIZE,
+                        encoding=None):
+    """Yields lists of the stripped lines of a stream, one list per block.
+    module decompresses the stream, if given."""
+    if encoding is None:
+        import locale
+        encoding = locale.getpreferredencoding(False)
+    stream = fobj if module is None else module.open(fobj, 'rb')
+    try:
+        for block in stream_blocks(stream, block_size=block_size):
+            yield split_block(block.decode(encoding))
+    finally:
+        if stream is not fobj:
+            stream.close()
+        # stdin is left open
+        if fobj is not sys.stdin.buffer:
+            fobj.close()
+
+
+def threaded(iterable, queue_size=QUEUE_BLOCKS):
+    """Yields the items of iterable, which are produced in a
+    background thread. At most queue_size items are produced ahead.
+    Exceptions of the thread are raised in the consumer."""
+    import queue
+    import threading
+    items = queue.Queue(maxsize=queue_size)
+    done = object()
+    stop = threading.Event()
+
+    def put(item):
+        # gives up if the consumer has stopped
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put(item):
+                    return
+        except BaseException as exc:
+            put((done, exc))
+        else:
+            put((done, None))
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = items.get()
+            if isinstance(item, tuple) and item and item[0] is done:
+                if item[1] is not None:
+                    raise item[1]
+                return
+            yield item
+    finally:
+        stop.set()
+
+
+def read_lines(path, use_mmap=False):
+    """Yields the stripped lines of a file"""
+    fobj, module = open_input(path)
+    if module is not None or not is_regular(fobj):
+        return itertools.chain.from_iterable(
+            threaded(stream_line_batches(fobj, module)))
+    if use_mmap:
+        return itertools.chain.from_iterable(mmap_line_batches(fobj))
+    return text_lines(fobj)
+
+
+def read_references(path, refsep='*#', use_mmap=False):
+    """Yields the lists of alternative references on each line"""
+    fobj, module = open_input(path)
+    if module is not None or not is_regular(fobj):
+        return itertools.chain.from_iterable(threaded(
+            [line.split(refsep) for line in batch]
+            for batch in stream_line_batches(fobj, module)))
+    if use_mmap:
+        return itertools.chain.from_iterable(
+            [line.split(refsep) for line in batch]
+            for batch in mmap_line_batches(fobj))
+    return (line.split(refsep) for line in text_lines(fobj))
+
+
+def read_nbest(path, use_mmap=False):
+    """Yields (source_id, candidates) from a Moses n-best list,
+    in which the lines of each source sentence are consecutive:
+      id ||| hypothesis ||| features ||| score
+    Only one source sentence is held in memory at a time."""
+    fields = (line.split('|||', 2) for line in read_lines(path, use_mmap)
+              if line)
+    for (source_id, group) in itertools.groupby(
+            fields, key=lambda parts: parts[0].strip()):
+        candidates = []
+        for parts in group:
+            if len(parts) < 2:
+                raise ValueError('Not an n-best list line: {}'.format(
+                    '|||'.join(parts)))
+            candidates.append(parts[1].strip())
+        yield (int(source_id), candidates)
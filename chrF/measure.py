@@ -10,51 +10,227 @@ This implementation (c) Stig-Arne Grönroos 2016.
 
 import collections
 import itertools
+import operator
 import sys
 
 Errors = collections.namedtuple('Errors',
     ['count', 'precrec', 'missing', 'hyplen', 'reflen'])
 
+# number of lines sent to a worker process,
+# or to a vectorized engine, at a time
+CHUNK_SIZE = 1000
+
+# n-gram counting and matching implementations
+ENGINES = ('python', 'numpy')
+
+# characters of a line counted at a time, so that the n-gram lists
+# of very long lines (whole documents) are never built at once
+COUNT_BLOCK = 1 << 16
+
 #__all__ = []
 
-def chrf(hypothesis, references, beta=2.0, use_space=True):
+def chrf(hypothesis, references, beta=2.0, use_space=True,
+         engine='python'):
     """convenience function for the most common setting:
     equally weighted n-grams up to length 6"""
     factor = beta ** 2
     max_n = 6
     nw = [1/float(max_n) for _ in range(max_n)]
-    stats = evaluate_single(hypothesis, references, max_n, factor)
+    if engine == 'python':
+        stats = evaluate_single(hypothesis, references, max_n, factor,
+                                use_space=use_space, missing=False)
+    else:
+        _, sentences = evaluate_chunk([(hypothesis, references)],
+                                      max_n, factor, use_space,
+                                      keep_sentences=True, engine=engine,
+                                      missing=False)
+        stats = sentences[0]
     pres, recs, fs = stats.ngram_prf(factor)
     _, _, score = apply_ngram_weights(pres, recs, fs, nw)
     return score
 
+def nbest_scores(candidates, references, beta=2.0, use_space=True,
+                 engine='python'):
+    """As chrf, for each of the candidate translations
+    of one source sentence. The references are processed only once."""
+    factor = beta ** 2
+    max_n = 6
+    nw = [1/float(max_n) for _ in range(max_n)]
+    scores = []
+    for stats in nbest_stats(candidates, references, max_n,
+                             use_space=use_space, engine=engine):
+        pres, recs, fs = stats.ngram_prf(factor)
+        scores.append(apply_ngram_weights(pres, recs, fs, nw)[2])
+    return scores
+
+def nbest_stats(candidates, references, max_n, use_space=True,
+                engine='python'):
+    """Stats of each candidate against the same references.
+    Repeated candidates are scored once."""
+    unique = list(dict.fromkeys(candidates))
+    if engine == 'python':
+        if not isinstance(references, ReferenceProfile):
+            references = ReferenceProfile(references, max_n,
+                                          use_space=use_space)
+        all_stats = [evaluate_single(candidate, references, max_n,
+                                     use_space=use_space, missing=False)
+                     for candidate in unique]
+    else:
+        if isinstance(references, ReferenceProfile):
+            references = references.references
+        _, all_stats = evaluate_chunk(
+            [(candidate, references) for candidate in unique],
+            max_n, None, use_space, keep_sentences=True, engine=engine)
+    by_candidate = dict(zip(unique, all_stats))
+    return [by_candidate[candidate] for candidate in candidates]
+
+def chrf_matrix(candidates, references=None, beta=2.0, use_space=True,
+                engine=None):
+    """chrf of each candidate against each reference on its own:
+    result[i][j] == chrf(candidates[i], [references[j]]).
+    Without references, the candidates are scored against each other,
+    as in minimum Bayes risk decoding.
+    The n-grams of each string are counted once, and the clipped
+    overlap of a pair serves for both directions.
+    The engine defaults to numpy if NumPy is installed: the python
+    engine matches every pair in Python, which for 256 samples of
+    50 words takes seconds rather than a fraction of a second.
+    Returns a list of rows with either engine
+    (vectorized.chrf_matrix returns the NumPy array)."""
+    max_n = 6
+    if engine is None:
+        from . import vectorized
+        engine = 'python' if vectorized.np is None else 'numpy'
+    if engine == 'numpy':
+        from .vectorized import chrf_matrix as numpy_chrf_matrix
+        return numpy_chrf_matrix(candidates, references, max_n,
+                                 beta=beta, use_space=use_space).tolist()
+    elif engine != 'python':
+        raise ValueError('Unknown engine {}'.format(engine))
+    factor = beta ** 2
+    nw = [1/float(max_n) for _ in range(max_n)]
+    hyp_counts = [ngram_counts(line, max_n, use_space=use_space)
+                  for line in candidates]
+    hyp_lens = [ngram_lengths(line, max_n, use_space=use_space)
+                for line in candidates]
+    same = references is None
+    if same:
+        ref_counts, ref_lens = hyp_counts, hyp_lens
+    else:
+        ref_counts = [ngram_counts(line, max_n, use_space=use_space)
+                      for line in references]
+        ref_lens = [ngram_lengths(line, max_n, use_space=use_space)
+                    for line in references]
+    overlaps = {}
+    result = []
+    for (i, counts) in enumerate(hyp_counts):
+        row = []
+        for (j, other) in enumerate(ref_counts):
+            if same and j < i:
+                matches = overlaps.pop((j, i))
+            else:
+                matches = [overlap(counts[n], other[n])
+                           for n in range(max_n)]
+                if same and j > i:
+                    overlaps[(i, j)] = matches
+            stats = stats_from_matches(
+                max_n, hyp_lens[i],
+                [[(matches[n], ref_lens[j][n])] for n in range(max_n)])
+            pres, recs, fs = stats.ngram_prf(factor)
+            row.append(apply_ngram_weights(pres, recs, fs, nw)[2])
+        result.append(row)
+    return result
+
 def ngrams(line, n):
-    """Yields ngrams of length exactly n."""
-    offsets = [line[i:] for i in range(n)]
-    for ngram in zip(*offsets):
-        yield ngram
+    """Yields ngrams of length exactly n.
+    The n-grams are substrings of line: compact, with a cached hash,
+    and already in the form in which missing n-grams are shown."""
+    for i in range(len(line) - n + 1):
+        yield line[i:i + n]
 
 def ngrams_up_to(line, max_n, use_space=True):
     """Yields all character n-grams of lengths from 1 to max_n.
     If use_space is False, spaces are not counted as chars."""
     # space appended to treat last word equally to others
     # and for compatibility with original
+    line = prepare_line(line, use_space=use_space)
+    return list(ngram_lists(line, max_n))
+
+def ngram_lists(line, max_n):
+    """Yields the lists of n-grams of a prepared line,
+    for lengths from 1 to max_n (empty if longer than the line).
+    Each list is extended from the previous one by a character,
+    which avoids per-n-gram slicing in Python code."""
+    grams = list(line)
+    yield grams
+    for n in range(2, max_n + 1):
+        grams = list(map(operator.add, grams, line[n - 1:]))
+        yield grams
+
+def ngram_counts(line, max_n, use_space=True):
+    """Count tables of all character n-grams of lengths from 1 to max_n."""
+    line = prepare_line(line, use_space=use_space)
+    if len(line) > COUNT_BLOCK:
+        return block_counts(line, max_n)
+    # only one n-gram list is held at a time
+    return [collections.Counter(grams)
+            for grams in ngram_lists(line, max_n)]
+
+def block_counts(line, max_n, block_size=COUNT_BLOCK):
+    """As ngram_counts, for a prepared line, counting the n-grams
+    starting in one block of block_size characters at a time.
+    Each block is extended by max_n - 1 characters of the next,
+    for the n-grams crossing the boundary."""
+    counts = [collections.Counter() for _ in range(max_n)]
+    for start in range(0, len(line), block_size):
+        block = line[start:start + block_size + max_n - 1]
+        for (table, grams) in zip(counts, ngram_lists(block, max_n)):
+            table.update(itertools.islice(grams, block_size))
+    return counts
+
+def prepare_line(line, use_space=True):
+    """The line as seen by ngrams_up_to"""
     line += ' '
     if not use_space:
         line = line.replace(' ', '')
-    use_n = min(max_n, len(line))
-    result = []
-    for n in range(1, use_n + 1):
-        result.append(list(ngrams(line, n)))
-    for _ in range(max_n - use_n):
-        # empty lists for too long n-grams
-        result.append([])
-    return result
+    return line
+
+def ngram_lengths(line, max_n, use_space=True):
+    """Number of n-grams of each length from 1 to max_n"""
+    length = len(prepare_line(line, use_space=use_space))
+    return [max(0, length - i) for i in range(max_n)]
+
+def error_rate(errorcount, length, other_length):
+    """The precrec value of errors_n"""
+    if length != 0:
+        return 100. * errorcount / length
+    if other_length != 0:
+        return 100
+    return 0.
+
+def overlap(counts_a, counts_b):
+    """Clipped count of n-grams matching between two count tables"""
+    if len(counts_a) > len(counts_b):
+        counts_a, counts_b = counts_b, counts_a
+    return sum(min(count, counts_b[ngram])
+               for (ngram, count) in counts_a.items()
+               if ngram in counts_b)
+
+def unmatched(ngrams, counts):
+    """The ngrams left over after clipped matching against counts,
+    in the order errors_n reports them as missing."""
+    counts = collections.Counter(counts)
+    missing = []
+    for ngram in ngrams:
+        if counts[ngram] > 0:
+            counts[ngram] -= 1
+        else:
+            missing.append(ngram)
+    return missing
 
 def errors_n(hypothesis, reference):
     """Errors for a single length of n-gram"""
     errorcount = 0.0
-    precrec = 0.0
     missing = []
 
     ref_counts = collections.Counter(reference)
@@ -65,13 +241,7 @@ def errors_n(hypothesis, reference):
             errorcount += 1.
             missing.append(ngram)
 
-    if len(hypothesis) != 0:
-        precrec = 100. * errorcount / len(hypothesis)
-    else:
-        if len(reference) != 0:
-            precrec = 100
-        else:
-            precrec = 0.
+    precrec = error_rate(errorcount, len(hypothesis), len(reference))
 
     return Errors(errorcount, precrec, missing,
                   len(hypothesis), len(reference))
@@ -79,17 +249,181 @@ def errors_n(hypothesis, reference):
 def errors_multiref(hypothesis, references, max_n, use_space=True):
     """Yields errors in both directions,
     against the best matching of multiple references,
-    for all ngram lengths up to max_n"""
-    hyp_ngrams = ngrams_up_to(hypothesis, max_n, use_space=use_space)
-    ref_ngrams = zip(*(ngrams_up_to(line, max_n, use_space=use_space)
+    for all ngram lengths up to max_n.
+    The best references are selected from the clipped overlaps
+    (see prune_candidates), and errors_n is only run against them."""
+    # the n-grams of one order at a time
+    hyp_ngrams = ngram_lists(prepare_line(hypothesis, use_space=use_space),
+                             max_n)
+    ref_ngrams = zip(*(ngram_lists(prepare_line(line, use_space=use_space),
+                                   max_n)
                        for line in references))
+    bounds = None
     for (i, (hyp, refs)) in enumerate(zip(hyp_ngrams, ref_ngrams)):
-        best_hyp_error = min((errors_n(hyp, ref) for ref in refs),
-                             key=lambda x: x.precrec)
-        best_ref_error = min((errors_n(ref, hyp) for ref in refs),
-                             key=lambda x: x.precrec)
+        hyp_counts = collections.Counter(hyp)
+        ref_lens = [len(ref) for ref in refs]
+        bounds = match_bounds(len(hyp), ref_lens, bounds)
+        candidates = prune_candidates(
+            len(hyp), ref_lens, bounds,
+            lambda j: overlap(hyp_counts, collections.Counter(refs[j])))
+        best_hyp, best_ref = select_references(len(hyp), candidates)
+        bounds = [matches for (matches, _) in candidates]
+        yield (i,
+               errors_n(hyp, refs[best_hyp]),
+               errors_n(refs[best_ref], hyp))
+
+def select_references(hyp_len, candidates):
+    """Indices of the references errors_multiref selects as best
+    in the hypothesis and reference directions,
+    given the (matches, ref_len) of each reference."""
+    best_hyp = min(
+        range(len(candidates)),
+        key=lambda j: error_rate(hyp_len - candidates[j][0],
+                                 hyp_len, candidates[j][1]))
+    best_ref = min(
+        range(len(candidates)),
+        key=lambda j: error_rate(candidates[j][1] - candidates[j][0],
+                                 candidates[j][1], hyp_len))
+    return (best_hyp, best_ref)
+
+def match_bounds(hyp_len, ref_lens, previous=None):
+    """Upper bounds on the clipped overlap of each reference at an order,
+    given the overlaps (or their bounds) at the order below.
+    Each matching n-gram also matches with its first n - 1 characters,
+    so the overlap can not grow with the order."""
+    if previous is None:
+        return [min(hyp_len, ref_len) for ref_len in ref_lens]
+    return [min(bound, hyp_len, ref_len)
+            for (bound, ref_len) in zip(previous, ref_lens)]
+
+def prune_candidates(hyp_len, ref_lens, bounds, count_matches):
+    """(matches, ref_len) of each reference, for select_references.
+    The overlap is counted with count_matches(j) only for the references
+    that can still be selected in either direction, trying those with
+    the highest bound first. For the others, the bound stands in for the
+    matches: even with it they lose, ties going to the lower index as in
+    select_references, so the selection is the same as with all counted."""
+    candidates = [(bound, ref_len) for (bound, ref_len)
+                  in zip(bounds, ref_lens)]
+    best_hyp = None
+    best_ref = None
+    for j in sorted(range(len(ref_lens)), key=lambda j: -bounds[j]):
+        ref_len = ref_lens[j]
+        if bounds[j] > 0:
+            # the error rates can be no lower than with the bound
+            hyp_rate = (error_rate(hyp_len - bounds[j], hyp_len, ref_len), j)
+            ref_rate = (error_rate(ref_len - bounds[j], ref_len, hyp_len), j)
+            if best_hyp is not None and hyp_rate > best_hyp \
+                    and ref_rate > best_ref:
+                continue
+            matches = count_matches(j)
+            candidates[j] = (matches, ref_len)
+        else:
+            # the bound is exact
+            matches = 0
+        hyp_rate = (error_rate(hyp_len - matches, hyp_len, ref_len), j)
+        ref_rate = (error_rate(ref_len - matches, ref_len, hyp_len), j)
+        if best_hyp is None or hyp_rate < best_hyp:
+            best_hyp = hyp_rate
+        if best_ref is None or ref_rate < best_ref:
+            best_ref = ref_rate
+    return candidates
+
+def stats_from_matches(max_n, hyp_lens, candidates):
+    """Stats of a single hypothesis from the per-order
+    hypothesis lengths and (matches, ref_len) of each reference"""
+    stats = Stats(max_n)
+    for i in range(max_n):
+        best_hyp, best_ref = select_references(hyp_lens[i], candidates[i])
+        matches, ref_len = candidates[i][best_hyp]
+        stats.hyp_err[i] = float(hyp_lens[i] - matches)
+        stats.hyp_len[i] = hyp_lens[i]
+        matches, ref_len = candidates[i][best_ref]
+        stats.ref_err[i] = float(ref_len - matches)
+        stats.ref_len[i] = ref_len
+    return stats
+
+class ReferenceProfile(object):
+    """Per-order n-gram count tables for the references of one segment.
+    Built once and reused for any number of hypotheses."""
+    def __init__(self, references, max_n, use_space=True):
+        self.references = list(references)
+        self.max_n = max_n
+        self.use_space = use_space
+        self.counts = [ngram_counts(ref, max_n, use_space=use_space)
+                       for ref in self.references]
+        self.lengths = [ngram_lengths(ref, max_n, use_space=use_space)
+                        for ref in self.references]
+
+    def check(self, max_n, use_space):
+        if (max_n, use_space) != (self.max_n, self.use_space):
+            raise ValueError(
+                'Reference profile built with max_n={}, use_space={} '
+                'used with max_n={}, use_space={}'.format(
+                    self.max_n, self.use_space, max_n, use_space))
+
+def errors_profile(hypothesis, profile, max_n, use_space=True):
+    """As errors_multiref, but against a ReferenceProfile.
+    Missing n-grams are only collected for the best matching reference."""
+    profile.check(max_n, use_space)
+    hyp_ngrams = ngram_lists(prepare_line(hypothesis, use_space=use_space),
+                             max_n)
+    bounds = None
+    for (i, hyp) in enumerate(hyp_ngrams):
+        hyp_counts = collections.Counter(hyp)
+        hyp_len = len(hyp)
+        ref_lens = [lens[i] for lens in profile.lengths]
+        bounds = match_bounds(hyp_len, ref_lens, bounds)
+        candidates = prune_candidates(
+            hyp_len, ref_lens, bounds,
+            lambda j: overlap(hyp_counts, profile.counts[j][i]))
+        bounds = [matches for (matches, _) in candidates]
+        best_hyp, best_ref = select_references(hyp_len, candidates)
+        matches, ref_len = candidates[best_hyp]
+        errorcount = float(hyp_len - matches)
+        best_hyp_error = Errors(
+            errorcount,
+            error_rate(errorcount, hyp_len, ref_len),
+            unmatched(hyp, profile.counts[best_hyp][i]),
+            hyp_len, ref_len)
+        matches, ref_len = candidates[best_ref]
+        errorcount = float(ref_len - matches)
+        ref_line = prepare_line(profile.references[best_ref], use_space)
+        best_ref_error = Errors(
+            errorcount,
+            error_rate(errorcount, ref_len, hyp_len),
+            unmatched(ngrams(ref_line, i + 1), hyp_counts),
+            ref_len, hyp_len)
         yield (i, best_hyp_error, best_ref_error)
 
+def match_counts(hypothesis, references, max_n, use_space=True):
+    """Per-order hypothesis lengths, and (matches, ref_len) of each reference.
+    The clipped overlap is counted at most once per reference and order,
+    and serves for both directions. For references that can not be
+    selected, an upper bound replaces it (see prune_candidates).
+    Missing n-grams are not collected."""
+    hyp_counts = ngram_counts(hypothesis, max_n, use_space=use_space)
+    hyp_lens = ngram_lengths(hypothesis, max_n, use_space=use_space)
+    if isinstance(references, ReferenceProfile):
+        references.check(max_n, use_space)
+        ref_counts = references.counts
+        ref_lens = references.lengths
+    else:
+        ref_counts = [ngram_counts(ref, max_n, use_space=use_space)
+                      for ref in references]
+        ref_lens = [ngram_lengths(ref, max_n, use_space=use_space)
+                    for ref in references]
+    candidates = []
+    bounds = None
+    for i in range(max_n):
+        order_lens = [lens[i] for lens in ref_lens]
+        bounds = match_bounds(hyp_lens[i], order_lens, bounds)
+        candidates.append(prune_candidates(
+            hyp_lens[i], order_lens, bounds,
+            lambda j: overlap(hyp_counts[i], ref_counts[j][i])))
+        bounds = [matches for (matches, _) in candidates[i]]
+    return (hyp_lens, candidates)
+
 def print_missing_ngrams(n_sentences, side, i, missing, compatible=False):
     sys.stdout.write('{}::{}-{}grams: '.format(
         n_sentences, side, i + 1))
@@ -145,11 +479,178 @@ def apply_ngram_weights(pres, recs, fs, ngram_weights):
     f   = sum(w * f for (w, f) in zip(ngram_weights, fs))
     return (pre, rec, f)
 
+class ChrFAccumulator(object):
+    """Running corpus level chrF, for online evaluation.
+    Hypotheses can be added one at a time or in batches,
+    and the accumulators of separate workers merged.
+    Scores are computed on demand from the running Stats.
+    Nothing is printed, and the state is picklable."""
+    def __init__(self, max_n=6, beta=2.0, ngram_weights=None,
+                 use_space=True, engine='python'):
+        self.max_n = max_n
+        self.beta = beta
+        self.ngram_weights = normalize_weights(ngram_weights, max_n)
+        self.use_space = use_space
+        self.engine = engine
+        self.n_sentences = 0
+        self.stats = Stats(max_n)
+
+    def add(self, hypothesis, references):
+        """Adds a single hypothesis, returning its sentence Stats"""
+        sent_stats = evaluate_single(hypothesis, references, self.max_n,
+                                     use_space=self.use_space,
+                                     missing=False)
+        self.stats += sent_stats
+        self.n_sentences += 1
+        return sent_stats
+
+    def add_batch(self, hypotheses, references_list):
+        """Adds a batch of hypotheses, each with a sequence of references"""
+        chunk = list(safe_zip(hypotheses, references_list))
+        chunk_stats, _ = evaluate_chunk(chunk, self.max_n, None,
+                                        self.use_space,
+                                        keep_sentences=False,
+                                        engine=self.engine)
+        self.stats += chunk_stats
+        self.n_sentences += len(chunk)
+
+    def merge(self, other):
+        """Adds the state of another accumulator to this one"""
+        if (other.max_n, other.use_space) != (self.max_n, self.use_space):
+            raise ValueError(
+                'Can not merge accumulators with different '
+                'max_n or use_space')
+        self.stats += other.stats
+        self.n_sentences += other.n_sentences
+        return self
+
+    def ngram_prf(self):
+        """Per-order precision, recall and f-score"""
+        return self.stats.ngram_prf(self.beta ** 2)
+
+    def prf(self):
+        pres, recs, fs = self.ngram_prf()
+        return apply_ngram_weights(pres, recs, fs, self.ngram_weights)
+
+    def precision(self):
+        return self.prf()[0]
+
+    def recall(self):
+        return self.prf()[1]
+
+    def score(self):
+        return self.prf()[2]
+
+class IncrementalScorer(object):
+    """Sentence level chrF of a hypothesis that is edited in place.
+    Each replace updates only the n-grams within max_n - 1 characters
+    of the edit, and the clipped matches against each reference,
+    so the Stats stay identical to those of evaluate_single."""
+    def __init__(self, hypothesis, references, max_n=6, beta=2.0,
+                 ngram_weights=None, use_space=True):
+        if not isinstance(references, ReferenceProfile):
+            references = ReferenceProfile(references, max_n,
+                                          use_space=use_space)
+        references.check(max_n, use_space)
+        self.profile = references
+        self.max_n = max_n
+        self.beta = beta
+        self.ngram_weights = normalize_weights(ngram_weights, max_n)
+        self.use_space = use_space
+        self.hypothesis = hypothesis
+        self.line = prepare_line(hypothesis, use_space=use_space)
+        self.counts = ngram_counts(hypothesis, max_n, use_space=use_space)
+        self.overlaps = [[overlap(self.counts[i], ref_counts[i])
+                          for i in range(max_n)]
+                         for ref_counts in self.profile.counts]
+
+    def line_offset(self, position):
+        """Position in self.line of a position in the hypothesis"""
+        if self.use_space:
+            return position
+        return position - self.hypothesis.count(' ', 0, position)
+
+    def replace(self, start, end, text):
+        """Replaces hypothesis[start:end] with text"""
+        if not 0 <= start <= end <= len(self.hypothesis):
+            raise ValueError('Invalid span {}:{}'.format(start, end))
+        a = self.line_offset(start)
+        b = self.line_offset(end)
+        if not self.use_space:
+            text_line = text.replace(' ', '')
+        else:
+            text_line = text
+        new_line = self.line[:a] + text_line + self.line[b:]
+        for n in range(1, self.max_n + 1):
+            self.update(n, self.line, a, b, -1)
+            self.update(n, new_line, a, a + len(text_line), 1)
+        self.line = new_line
+        self.hypothesis = self.hypothesis[:start] + text + \
+            self.hypothesis[end:]
+
+    def update(self, n, line, a, b, sign):
+        """Removes (sign -1) or adds (sign 1) the n-grams of line
+        that overlap line[a:b], or span position a if a == b"""
+        i = n - 1
+        counts = self.counts[i]
+        ref_counts = [ref[i] for ref in self.profile.counts]
+        overlaps = self.overlaps
+        for pos in range(max(0, a - i), min(b, len(line) - i)):
+            ngram = line[pos:pos + n]
+            count = counts.get(ngram, 0)
+            for (j, ref) in enumerate(ref_counts):
+                if sign < 0 and count <= ref.get(ngram, 0):
+                    overlaps[j][i] -= 1
+                elif sign > 0 and count < ref.get(ngram, 0):
+                    overlaps[j][i] += 1
+            if count + sign:
+                counts[ngram] = count + sign
+            else:
+                del counts[ngram]
+
+    def stats(self):
+        if not self.overlaps:
+            # no references, as in evaluate_single
+            return Stats(self.max_n)
+        hyp_lens = [max(0, len(self.line) - i) for i in range(self.max_n)]
+        candidates = [[(overlaps[i], lens[i])
+                       for (overlaps, lens)
+                       in zip(self.overlaps, self.profile.lengths)]
+                      for i in range(self.max_n)]
+        return stats_from_matches(self.max_n, hyp_lens, candidates)
+
+    def prf(self):
+        pres, recs, fs = self.stats().ngram_prf(self.beta ** 2)
+        return apply_ngram_weights(pres, recs, fs, self.ngram_weights)
+
+    def score(self):
+        return self.prf()[2]
+
 def evaluate_single(hypothesis, references, max_n, factor=None,
-                    use_space=True):
+                    use_space=True, missing=True):
+    """Stats of a single hypothesis.
+    The references are either a sequence of strings
+    or a ReferenceProfile.
+    Unless missing is set, the missing n-grams are not collected,
+    which allows a faster path through match_counts.
+    Without references, the stats are all zero."""
+    if isinstance(references, ReferenceProfile):
+        n_refs = len(references.references)
+    else:
+        n_refs = len(references)
+    if n_refs == 0:
+        return Stats(max_n)
+    if not missing:
+        hyp_lens, candidates = match_counts(hypothesis, references,
+                                            max_n, use_space=use_space)
+        return stats_from_matches(max_n, hyp_lens, candidates)
     stats = Stats(max_n)
-    errors = errors_multiref(hypothesis, references,
-                             max_n, use_space=use_space)
+    if isinstance(references, ReferenceProfile):
+        errors = errors_profile(hypothesis, references,
+                                max_n, use_space=use_space)
+    else:
+        errors = errors_multiref(hypothesis, references,
+                                 max_n, use_space=use_space)
     for (i, hyp_error, ref_error) in errors:
         # in both cases .hyplen is correct
         # hyplen is a misnomer: should be "length used for normalization"
@@ -213,6 +714,41 @@ def print_summary(stats, beta, ngram_weights,
         sys.stdout.write('chr{}\t{:.4f}\n'.format(
             'Rec', rec))
 
+def print_summary_table(names, stats, beta, ngram_weights,
+                        ngram_level=False, hide_precrec=False):
+    """Summary of several systems, one row per system"""
+    factor = beta ** 2
+    if ngram_level:
+        for (name, sys_stats) in zip(names, stats):
+            tot_pre, tot_rec, tot_f = sys_stats.ngram_prf(factor)
+            for i in range(sys_stats.max_n):
+                sys.stdout.write('{}::{}gram-{:6s}{:.4f}\n'.format(
+                    name, i + 1, 'F', tot_f[i]))
+                sys.stdout.write('{}::{}gram-{:6s}{:.4f}\n'.format(
+                    name, i + 1, 'Prec', tot_pre[i]))
+                sys.stdout.write('{}::{}gram-{:6s}{:.4f}\n'.format(
+                    name, i + 1, 'Rec', tot_rec[i]))
+
+    header = ['system', 'chrF-{}'.format(beta)]
+    if not hide_precrec:
+        header.extend(['chrPrec', 'chrRec'])
+    sys.stdout.write('\t'.join(header) + '\n')
+    for (name, sys_stats) in zip(names, stats):
+        tot_pre, tot_rec, tot_f = sys_stats.ngram_prf(factor)
+        pre, rec, f = apply_ngram_weights(
+            tot_pre, tot_rec, tot_f, ngram_weights)
+        row = [name, '{:.4f}'.format(f)]
+        if not hide_precrec:
+            row.extend(['{:.4f}'.format(pre), '{:.4f}'.format(rec)])
+        sys.stdout.write('\t'.join(row) + '\n')
+
+def normalize_weights(ngram_weights, max_n):
+    if ngram_weights is None:
+        return [1/float(max_n) for _ in range(max_n)]
+    ngram_weights = [float(w) for w in ngram_weights]
+    tot = sum(ngram_weights)
+    return [w / tot for w in ngram_weights]
+
 
 def evaluate(hyp_lines,
              ref_tuples,
@@ -225,29 +761,268 @@ def evaluate(hyp_lines,
              print_missing=False,
              sentence_level=False,
              ngram_level=False,
-             compatible=False):
-    n_sentences = 0
+             compatible=False,
+             jobs=1,
+             engine='python',
+             emit_stats=None,
+             profiler=None,
+             writer=None,
+             segment_cache=None):
+    """Evaluates hypothesis lines against the references.
+    With jobs > 1, the lines are scored in chunks by a pool of
+    worker processes. The results are identical to the serial case.
+    engine selects the n-gram counting implementation (see ENGINES).
+    Only the python engine collects missing n-grams,
+    so it is always used with print_missing (see score_chunks).
+    If emit_stats is given, the Stats of each sentence
+    are passed to its write method.
+    A profiling.Profiler can be given to count the scored sentences.
+    If writer (see chrF.output) is given, the scores are written with it
+    instead of printed as text.
+    With a cache.SegmentCache, only the segments not found in it
+    are scored, in this process."""
     factor = beta ** 2
+    keep_sentences = (sentence_level
+                      or emit_stats is not None
+                      or profiler is not None)
+
+    chunks = score_chunks(safe_zip(hyp_lines, ref_tuples),
+                          max_n,
+                          factor,
+                          use_space=use_space,
+                          keep_sentences=keep_sentences,
+                          jobs=jobs,
+                          engine=engine,
+                          missing=print_missing,
+                          segment_cache=segment_cache)
+    return report(chunks,
+                  max_n,
+                  beta=beta,
+                  ngram_weights=ngram_weights,
+                  summary=summary,
+                  hide_precrec=hide_precrec,
+                  print_missing=print_missing,
+                  sentence_level=sentence_level,
+                  ngram_level=ngram_level,
+                  compatible=compatible,
+                  emit_stats=emit_stats,
+                  profiler=profiler,
+                  writer=writer)
+
+
+def score_chunks(pairs, max_n, factor, use_space=True, keep_sentences=False,
+                 jobs=1, engine='python', missing=False, segment_cache=None):
+    """Scores (hypothesis, references) pairs as evaluate does.
+    Yields (chunk_stats, sentences) as evaluate_chunk,
+    or (None, sentences) if the sentences are not summed yet.
+    Only the python engine collects missing n-grams,
+    so it is always used with missing."""
+    if missing:
+        engine = 'python'
+    if segment_cache is not None and not missing:
+        return ((None, segment_cache.evaluate_chunk(chunk, max_n, factor,
+                                                    use_space=use_space,
+                                                    engine=engine))
+                for chunk in iter_chunks(pairs, CHUNK_SIZE))
+    elif jobs > 1:
+        return evaluate_parallel(pairs, max_n, factor,
+                                 use_space=use_space,
+                                 keep_sentences=keep_sentences,
+                                 jobs=jobs,
+                                 engine=engine,
+                                 missing=missing)
+    elif engine == 'python':
+        return ((None, [evaluate_single(hyp_line,
+                                        refs,
+                                        max_n,
+                                        factor,
+                                        use_space=use_space,
+                                        missing=missing)])
+                for (hyp_line, refs) in pairs)
+    return (evaluate_chunk(chunk, max_n, factor, use_space,
+                           keep_sentences=keep_sentences,
+                           engine=engine)
+            for chunk in iter_chunks(pairs, CHUNK_SIZE))
+
+
+def report(chunks,
+           max_n,
+           beta=1.0,
+           ngram_weights=None,
+           summary=True,
+           hide_precrec=False,
+           print_missing=False,
+           sentence_level=False,
+           ngram_level=False,
+           compatible=False,
+           emit_stats=None,
+           profiler=None,
+           writer=None):
+    """Sums and prints already computed Stats.
+    chunks yields (chunk_stats, sentences) as returned by evaluate_chunk,
+    or (None, sentences) if the sentences are not summed yet."""
+    n_sentences = 0
     tot_stats = Stats(max_n)
 
-    if ngram_weights is None:
-        ngram_weights = [1/float(max_n) for _ in range(max_n)]
+    ngram_weights = normalize_weights(ngram_weights, max_n)
+
+    for (chunk_stats, sentences) in chunks:
+        if chunk_stats is not None:
+            tot_stats += chunk_stats
+        for sent_stats in sentences:
+            n_sentences += 1
+            if chunk_stats is None:
+                tot_stats += sent_stats
+            if emit_stats is not None:
+                emit_stats.write(sent_stats)
+            if profiler is not None:
+                profiler.add_sentence(sent_stats)
+            if sentence_level and writer is not None:
+                writer.write(n_sentences, sent_stats)
+            elif sentence_level:
+                print_single(sent_stats,
+                             n_sentences,
+                             beta,
+                             ngram_weights,
+                             print_missing=print_missing,
+                             sentence_level=sentence_level,
+                             ngram_level=ngram_level,
+                             compatible=compatible)
+
+    if summary and writer is not None:
+        writer.write_summary(tot_stats)
+    elif summary:
+        print_summary(tot_stats, beta, ngram_weights,
+                      ngram_level, hide_precrec)
+    return tot_stats
+
+
+def evaluate_chunk(chunk, max_n, factor, use_space, keep_sentences,
+                   engine='python', missing=False):
+    """Summed Stats of a chunk of (hypothesis, references) pairs,
+    and the Stats of each sentence if keep_sentences is set."""
+    if engine == 'python':
+        all_stats = (evaluate_single(hyp_line,
+                                     refs,
+                                     max_n,
+                                     factor,
+                                     use_space=use_space,
+                                     missing=missing)
+                     for (hyp_line, refs) in chunk)
+    elif engine == 'numpy':
+        from .vectorized import evaluate_batch
+        all_stats = evaluate_batch(chunk, max_n, use_space=use_space)
     else:
-        tot = sum(ngram_weights)
-        ngram_weights = [float(w) / tot for w in ngram_weights]
-
-    for (hyp_line, refs) in safe_zip(hyp_lines, ref_tuples):
-        n_sentences += 1
-        sent_stats = evaluate_single(
-            hyp_line,
-            refs,
-            max_n,
-            factor,
-            use_space=use_space)
-        tot_stats += sent_stats
-        if sentence_level:
+        raise ValueError('Unknown engine {}'.format(engine))
+    chunk_stats = Stats(max_n)
+    sentences = []
+    for sent_stats in all_stats:
+        chunk_stats += sent_stats
+        if keep_sentences:
+            sentences.append(sent_stats)
+    return (chunk_stats, sentences)
+
+
+def iter_chunks(iterable, size):
+    """Consecutive lists of up to size items"""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def evaluate_parallel(pairs, max_n, factor, use_space=True,
+                      keep_sentences=False, jobs=2,
+                      chunk_size=CHUNK_SIZE, engine='python',
+                      missing=False):
+    """Yields the results of evaluate_chunk for consecutive chunks
+    of pairs, in input order, scoring them in a process pool.
+    Only a bounded number of chunks is in flight at a time."""
+    chunks = iter_chunks(pairs, chunk_size)
+    # imported here, as it is slow to import and rarely needed
+    import multiprocessing
+    pool = multiprocessing.Pool(jobs)
+    try:
+        pending = collections.deque()
+        while True:
+            for chunk in itertools.islice(chunks, 2 * jobs - len(pending)):
+                pending.append(pool.apply_async(
+                    evaluate_chunk,
+                    (chunk, max_n, factor, use_space, keep_sentences,
+                     engine, missing)))
+            if not pending:
+                break
+            yield pending.popleft().get()
+    finally:
+        pool.terminate()
+
+
+def evaluate_systems(system_lines,
+                     ref_tuples,
+                     max_n,
+                     beta=1.0,
+                     ngram_weights=None,
+                     use_space=True,
+                     summary=True,
+                     hide_precrec=False,
+                     print_missing=False,
+                     sentence_level=False,
+                     ngram_level=False,
+                     compatible=False,
+                     names=None,
+                     jobs=1,
+                     engine='python',
+                     profiler=None,
+                     writer=None,
+                     segment_cache=None):
+    """Evaluates several systems against the same references in one pass.
+    system_lines is a sequence of hypothesis line iterables,
+    which are read in lockstep with ref_tuples.
+    With the python engine in a single process, the reference n-grams
+    of each line are counted only once.
+    Returns a list of Stats, one per system."""
+    n_sentences = 0
+    factor = beta ** 2
+    n_systems = len(system_lines)
+    if names is None:
+        names = [str(k + 1) for k in range(n_systems)]
+    tot_stats = [Stats(max_n) for _ in system_lines]
+
+    ngram_weights = normalize_weights(ngram_weights, max_n)
+
+    def pairs():
+        for row in safe_zip(ref_tuples, *system_lines):
+            refs = row[0]
+            # profiles are not worth sending to worker processes
+            if jobs == 1 and engine == 'python' \
+                    and not isinstance(refs, ReferenceProfile):
+                refs = ReferenceProfile(refs, max_n, use_space=use_space)
+            for hyp_line in row[1:]:
+                yield (hyp_line, refs)
+
+    scored = score_chunks(pairs(), max_n, factor,
+                          use_space=use_space,
+                          keep_sentences=True,
+                          jobs=jobs,
+                          engine=engine,
+                          missing=print_missing,
+                          segment_cache=segment_cache)
+    sentences = itertools.chain.from_iterable(
+        sentences for (_, sentences) in scored)
+    for (i, sent_stats) in enumerate(sentences):
+        k = i % n_systems
+        if k == 0:
+            n_sentences += 1
+        tot_stats[k] += sent_stats
+        if profiler is not None:
+            profiler.add_sentence(sent_stats)
+        if sentence_level and writer is not None:
+            writer.write(n_sentences, sent_stats, system=names[k])
+        elif sentence_level:
             print_single(sent_stats,
-                         n_sentences,
+                         '{}:{}'.format(names[k], n_sentences),
                          beta,
                          ngram_weights,
                          print_missing=print_missing,
@@ -255,7 +1030,68 @@ def evaluate(hyp_lines,
                          ngram_level=ngram_level,
                          compatible=compatible)
 
-    if summary:
+    if summary and writer is not None:
+        for (name, sys_stats) in zip(names, tot_stats):
+            writer.write_summary(sys_stats, system=name)
+    elif summary:
+        print_summary_table(names, tot_stats, beta, ngram_weights,
+                            ngram_level, hide_precrec)
+    return tot_stats
+
+
+def evaluate_nbest(nbest,
+                   ref_tuples,
+                   max_n,
+                   beta=1.0,
+                   ngram_weights=None,
+                   use_space=True,
+                   summary=True,
+                   hide_precrec=False,
+                   ngram_level=False,
+                   engine='python',
+                   profiler=None,
+                   writer=None):
+    """Evaluates n-best lists.
+    nbest yields (source_id, candidates), in increasing order of
+    source_id, which is the 0-based line number in ref_tuples.
+    The score of each candidate is printed, labeled '{id}:{k}'.
+    The summary and the returned Stats are of the first candidate
+    of each source sentence."""
+    tot_stats = Stats(max_n)
+    ngram_weights = normalize_weights(ngram_weights, max_n)
+    ref_lines = enumerate(ref_tuples)
+    line_n = -1
+    for (source_id, candidates) in nbest:
+        if source_id <= line_n:
+            raise ValueError('N-best list ids must be increasing, '
+                             'got {} after {}'.format(source_id, line_n))
+        while line_n < source_id:
+            line_n, refs = next(ref_lines, (None, None))
+            if line_n is None:
+                raise ValueError('No reference for n-best list id {}'.format(
+                    source_id))
+        all_stats = nbest_stats(candidates, refs, max_n,
+                                use_space=use_space, engine=engine)
+        tot_stats += all_stats[0]
+        for (k, sent_stats) in enumerate(all_stats):
+            if profiler is not None:
+                profiler.add_sentence(sent_stats)
+            label = '{}:{}'.format(source_id, k)
+            if writer is not None:
+                writer.write(label, sent_stats)
+            else:
+                print_single(sent_stats,
+                             label,
+                             beta,
+                             ngram_weights,
+                             print_missing=False,
+                             sentence_level=True,
+                             ngram_level=ngram_level,
+                             compatible=False)
+
+    if summary and writer is not None:
+        writer.write_summary(tot_stats)
+    elif summary:
         print_summary(tot_stats, beta, ngram_weights,
                       ngram_level, hide_precrec)
     return tot_stats
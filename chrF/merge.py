@@ -0,0 +1,98 @@
+# -*- coding: utf-8
+"""Combines the shard files of a sharded evaluation.
+
+Each node scores its part of the corpus with --shard-out.
+The summed Stats of the shards are added up as Stats.__iadd__ does,
+so the summary equals that of scoring the whole corpus at once.
+"""
+import argparse
+import sys
+
+from .measure import Stats, normalize_weights, print_summary
+from .statsfile import read_shard
+
+
+def merge_shards(shards):
+    """Sums (shard, stats) pairs read with read_shard.
+    Returns (max_n, use_space, n_sentences, stats).
+    Raises ValueError if the shards were scored with different
+    parameters, or if their line ranges overlap."""
+    if not shards:
+        raise ValueError('No shards to merge')
+    max_n = shards[0][0]['max_n']
+    use_space = shards[0][0]['use_space']
+    tot_stats = Stats(max_n)
+    n_sentences = 0
+    for (shard, stats) in shards:
+        if (shard['max_n'], shard['use_space']) != (max_n, use_space):
+            raise ValueError('Shards have different max_n or use_space')
+        tot_stats += stats
+        n_sentences += shard['sentences']
+    check_ranges(shard for (shard, _) in shards)
+    return (max_n, use_space, n_sentences, tot_stats)
+
+
+def check_ranges(shards):
+    """Raises ValueError if the line ranges of shards overlap,
+    and warns about gaps between them"""
+    ranges = sorted((shard['first_line'], shard['sentences'])
+                    for shard in shards if 'first_line' in shard)
+    for ((start, length), (next_start, _)) in zip(ranges, ranges[1:]):
+        if start + length > next_start:
+            raise ValueError('Shards starting at lines {} and {} '
+                             'overlap'.format(start, next_start))
+        if start + length < next_start:
+            sys.stderr.write('chrF: lines {}-{} are not in any shard\n'.format(
+                start + length, next_start - 1))
+
+
+def get_argparser():
+    parser = argparse.ArgumentParser(
+        prog='chrF merge',
+        description='Combines the shard files written with --shard-out.',
+        epilog="""
+Usage example:
+
+  %(prog)s -b 2.0 part1.shard part2.shard part3.shard
+
+""",
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+
+    add_arg = parser.add_argument
+    add_arg('shards', nargs='+', metavar='SHARD',
+            help='Shard files.')
+
+    add_arg = parser.add_argument_group(
+        'algorithm parameters').add_argument
+    add_arg('-w', '--nweight', default=None,
+            help='comma separated ngram weights. '
+                 '(default uniform 1/n).')
+    add_arg('-b', '--beta', type=float, default=1.0,
+            help='balance parameter for f-measure. '
+                 '(default %(default)s).')
+
+    add_arg = parser.add_argument_group(
+        'output options').add_argument
+    add_arg('--hide-precrec', default=False, action='store_true',
+            help='Suppress precision and recall in summary.')
+    add_arg('--show-ngram', dest='ngram_level',
+            default=False, action='store_true',
+            help='Show n-gram level scores.')
+
+    return parser
+
+
+def merge_main(args):
+    shards = []
+    for path in args.shards:
+        with open(path, 'r') as fobj:
+            shards.append(read_shard(fobj))
+    max_n, _, _, stats = merge_shards(shards)
+    if args.nweight is None:
+        ngram_weights = None
+    else:
+        ngram_weights = args.nweight.split(',')
+    print_summary(stats, args.beta,
+                  normalize_weights(ngram_weights, max_n),
+                  args.ngram_level, args.hide_precrec)
+    return stats
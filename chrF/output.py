@@ -0,0 +1,124 @@
+# -*- coding: utf-8
+"""Structured output of sentence and corpus level scores.
+
+Each record holds the weighted chrF, chrPrec and chrRec and the F,
+Prec and Rec of every n-gram order, so that it can be loaded downstream
+without parsing the text format. Formatted records are buffered and
+written in batches. The corpus totals are written as a last record
+with the id "total".
+"""
+import sys
+
+from .measure import apply_ngram_weights, normalize_weights
+
+FORMATS = ('text', 'tsv', 'jsonl')
+
+# records formatted before each write to the stream
+BUFFER_RECORDS = 1000
+
+
+class RecordWriter(object):
+    """Base of the structured writers. Subclasses implement format."""
+    def __init__(self, max_n, beta, ngram_weights=None, systems=False,
+                 missing=False, stream=None):
+        self.max_n = max_n
+        self.beta = beta
+        self.factor = beta ** 2
+        self.ngram_weights = normalize_weights(ngram_weights, max_n)
+        self.systems = systems
+        self.missing = missing
+        self.stream = sys.stdout if stream is None else stream
+        self.buffer = []
+
+    def scores(self, stats):
+        """(chrF, chrPrec, chrRec, ngram Fs, ngram Precs, ngram Recs)"""
+        pres, recs, fs = stats.ngram_prf(self.factor)
+        pre, rec, f = apply_ngram_weights(pres, recs, fs, self.ngram_weights)
+        return (f, pre, rec, fs, pres, recs)
+
+    def write(self, sentence_id, stats, system=None):
+        self.buffer.append(self.format(sentence_id, stats, system))
+        if len(self.buffer) >= BUFFER_RECORDS:
+            self.flush()
+
+    def write_summary(self, stats, system=None):
+        self.write('total', stats, system)
+
+    def flush(self):
+        if self.buffer:
+            self.stream.write(''.join(self.buffer))
+            self.buffer = []
+
+    def close(self):
+        self.flush()
+        self.stream.flush()
+
+
+class TsvWriter(RecordWriter):
+    """Tab separated values, with a header line"""
+    def __init__(self, *args, **kwargs):
+        super(TsvWriter, self).__init__(*args, **kwargs)
+        if self.missing:
+            raise ValueError('Missing n-grams can not be written as TSV')
+        header = ['id', 'chrF-{}'.format(self.beta), 'chrPrec', 'chrRec']
+        for i in range(self.max_n):
+            header.extend('{}gram-{}'.format(i + 1, name)
+                          for name in ('F', 'Prec', 'Rec'))
+        if self.systems:
+            header.insert(0, 'system')
+        self.buffer.append('\t'.join(header) + '\n')
+        self.template = '\t'.join(
+            ['{}'] + ['{:.4f}'] * (3 + 3 * self.max_n)) + '\n'
+
+    def format(self, sentence_id, stats, system):
+        f, pre, rec, fs, pres, recs = self.scores(stats)
+        values = [f, pre, rec]
+        for i in range(self.max_n):
+            values.extend((fs[i], pres[i], recs[i]))
+        line = self.template.format(sentence_id, *values)
+        if self.systems:
+            return '{}\t{}'.format(system, line)
+        return line
+
+
+class JsonlWriter(RecordWriter):
+    """One JSON object per line"""
+    def __init__(self, *args, **kwargs):
+        super(JsonlWriter, self).__init__(*args, **kwargs)
+        # imported here, as this module is imported at startup
+        import json
+        self.dumps = json.dumps
+
+    def format(self, sentence_id, stats, system):
+        f, pre, rec, fs, pres, recs = self.scores(stats)
+        record = {'id': sentence_id,
+                  'chrF': f,
+                  'chrPrec': pre,
+                  'chrRec': rec,
+                  'beta': self.beta,
+                  'ngram_F': fs,
+                  'ngram_Prec': pres,
+                  'ngram_Rec': recs}
+        if self.systems:
+            record['system'] = system
+        if self.missing and stats.ref_missing is not None:
+            record['ref_missing'] = [[''.join(ngram) for ngram in missing]
+                                     for missing in stats.ref_missing]
+            record['hyp_missing'] = [[''.join(ngram) for ngram in missing]
+                                     for missing in stats.hyp_missing]
+        return self.dumps(record, ensure_ascii=False) + '\n'
+
+
+WRITERS = {'tsv': TsvWriter, 'jsonl': JsonlWriter}
+
+
+def get_writer(output_format, max_n, beta, ngram_weights=None,
+               systems=False, missing=False, stream=None):
+    """A writer for output_format, or None for the text format"""
+    if output_format == 'text':
+        return None
+    if output_format not in WRITERS:
+        raise ValueError('Unknown output format {}'.format(output_format))
+    return WRITERS[output_format](max_n, beta, ngram_weights,
+                                  systems=systems, missing=missing,
+                                  stream=stream)
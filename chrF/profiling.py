@@ -0,0 +1,214 @@
+# -*- coding: utf-8
+"""Per-phase timing and progress reporting for long scoring runs.
+
+While instrumented, the n-gram extraction, matching and output
+functions of chrF.measure are replaced by timing wrappers.
+Only the outermost phase is charged when they call each other,
+so the phase times add up to at most the wall time.
+Work done in worker processes (--jobs) is not broken down by phase.
+"""
+import collections
+import contextlib
+import functools
+import inspect
+import json
+import sys
+import time
+
+from . import measure
+
+# phase: names of the functions in chrF.measure charged to it
+PHASES = collections.OrderedDict([
+    ('ngrams', ('ngrams_up_to', 'ngram_lists', 'ngram_counts',
+                'block_counts')),
+    ('matching', ('errors_n', 'overlap', 'unmatched', 'stats_from_matches')),
+    ('output', ('print_single', 'print_summary', 'print_summary_table')),
+])
+
+# methods of output.RecordWriter (--output-format) charged to output
+WRITER_METHODS = ('write', 'flush', 'close')
+
+
+def current_rss():
+    """Resident set size in bytes, or None if not available"""
+    try:
+        with open('/proc/self/statm', 'r') as fobj:
+            pages = int(fobj.read().split()[1])
+        import resource
+        return pages * resource.getpagesize()
+    except (IOError, OSError, ValueError, IndexError, ImportError):
+        pass
+    try:
+        import resource
+        # peak rather than current, in KiB on Linux and bytes on macOS
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss if sys.platform == 'darwin' else maxrss * 1024
+    except ImportError:
+        return None
+
+
+def count_lines(path):
+    """Number of lines in an uncompressed file, used for the ETA"""
+    count = 0
+    last = b'\n'
+    with open(path, 'rb') as fobj:
+        for block in iter(lambda: fobj.read(1 << 20), b''):
+            count += block.count(b'\n')
+            last = block[-1:]
+    if last != b'\n':
+        count += 1
+    return count
+
+
+class Profiler(object):
+    """Cumulative time per phase, with optional periodic progress
+    lines (sentences/s, n-grams/s, RSS and ETA) on stderr."""
+    def __init__(self, progress=False, interval=5.0, total=None,
+                 stream=None):
+        self.progress = progress
+        self.interval = interval
+        self.total = total
+        self.stream = sys.stderr if stream is None else stream
+        self.times = collections.defaultdict(float)
+        self.calls = collections.defaultdict(int)
+        self.sentences = 0
+        self.ngrams = 0
+        self.peak_rss = 0
+        self.active = None
+        self.start = time.perf_counter()
+        self.last_report = self.start
+
+    def wrap(self, phase, func):
+        """A wrapper of func charging its time to phase"""
+        if inspect.isgeneratorfunction(func):
+            return self.wrap_generator(phase, func)
+
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            if self.active is not None:
+                return func(*args, **kwargs)
+            self.active = phase
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.times[phase] += time.perf_counter() - start
+                self.calls[phase] += 1
+                self.active = None
+        return timed
+
+    def wrap_generator(self, phase, func):
+        """As wrap, for a generator function. The time spent in
+        producing each item is charged to phase, as the caller may
+        do other work between the items."""
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            iterator = func(*args, **kwargs)
+            if self.active is None:
+                self.calls[phase] += 1
+            while True:
+                if self.active is not None:
+                    item = next(iterator, StopIteration)
+                else:
+                    self.active = phase
+                    start = time.perf_counter()
+                    try:
+                        item = next(iterator, StopIteration)
+                    finally:
+                        self.times[phase] += time.perf_counter() - start
+                        self.active = None
+                if item is StopIteration:
+                    return
+                yield item
+        return timed
+
+    def timed_iter(self, phase, iterable):
+        """Yields from iterable, charging the time spent in it to phase"""
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.times[phase] += time.perf_counter() - start
+                return
+            self.times[phase] += time.perf_counter() - start
+            self.calls[phase] += 1
+            yield item
+
+    @contextlib.contextmanager
+    def instrument(self):
+        """Replaces the functions of chrF.measure listed in PHASES,
+        and the WRITER_METHODS of the structured writers,
+        by timing wrappers for the duration of the block"""
+        from .output import RecordWriter
+        targets = [(measure, name, phase)
+                   for (phase, names) in PHASES.items()
+                   for name in names]
+        targets.extend((RecordWriter, name, 'output')
+                       for name in WRITER_METHODS)
+        originals = []
+        for (owner, name, phase) in targets:
+            func = getattr(owner, name)
+            originals.append((owner, name, func))
+            setattr(owner, name, self.wrap(phase, func))
+        try:
+            yield self
+        finally:
+            for (owner, name, func) in originals:
+                setattr(owner, name, func)
+
+    def add_sentence(self, stats):
+        """Counts a scored sentence, and reports progress when due"""
+        self.sentences += 1
+        self.ngrams += sum(stats.hyp_len) + sum(stats.ref_len)
+        if self.progress:
+            now = time.perf_counter()
+            if now - self.last_report >= self.interval:
+                self.last_report = now
+                self.report_progress(now)
+
+    def report_progress(self, now=None):
+        if now is None:
+            now = time.perf_counter()
+        elapsed = max(now - self.start, 1e-9)
+        rate = self.sentences / elapsed
+        parts = ['{} sentences'.format(self.sentences),
+                 '{:.1f} sent/s'.format(rate),
+                 '{:.0f} ngrams/s'.format(self.ngrams / elapsed)]
+        rss = current_rss()
+        if rss is not None:
+            self.peak_rss = max(self.peak_rss, rss)
+            parts.append('RSS {:.1f} MiB'.format(rss / 2. ** 20))
+        if self.total is not None and rate > 0:
+            remaining = max(self.total - self.sentences, 0) / rate
+            parts.append('ETA {}:{:02d}:{:02d}'.format(
+                int(remaining // 3600),
+                int(remaining % 3600 // 60),
+                int(remaining % 60)))
+        self.stream.write('chrF: {}\n'.format(', '.join(parts)))
+        self.stream.flush()
+
+    def summary(self):
+        """The profile as a JSON-serializable dict"""
+        wall = time.perf_counter() - self.start
+        rss = current_rss()
+        if rss is not None:
+            self.peak_rss = max(self.peak_rss, rss)
+        phases = dict(self.times)
+        phases['other'] = max(wall - sum(self.times.values()), 0.)
+        return {
+            'wall_seconds': wall,
+            'phases': phases,
+            'calls': dict(self.calls),
+            'sentences': self.sentences,
+            'ngrams': self.ngrams,
+            'sentences_per_sec': self.sentences / wall if wall > 0 else 0.,
+            'ngrams_per_sec': self.ngrams / wall if wall > 0 else 0.,
+            'peak_rss_bytes': self.peak_rss or None,
+        }
+
+    def write(self, path):
+        with open(path, 'w') as fobj:
+            json.dump(self.summary(), fobj, indent=2, sort_keys=True)
+            fobj.write('\n')
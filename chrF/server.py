@@ -0,0 +1,385 @@
+# -*- coding: utf-8
+"""Long-running scoring server.
+
+Reference sets are registered once, and their n-gram profiles are kept
+in memory. Scoring requests name a reference set and give hypotheses
+for some or all of its lines. Requests arriving within a short window
+are coalesced into one scoring batch, in which identical segments are
+scored only once.
+
+Requests and responses are JSON objects. Over a Unix socket, they are
+sent one per line. Over TCP, each request is the body of an HTTP POST.
+
+  {"op": "register", "id": "test", "references": [["ref 1", "alt 1"], ...]}
+  {"op": "score", "ref_set": "test", "hypotheses": ["hyp 1", ...]}
+  {"op": "score", "ref_set": "test", "hypotheses": [...], "lines": [4, 2]}
+  {"op": "unregister", "id": "test"}
+  {"op": "list"}
+
+Score responses hold the chrF, chrPrec and chrRec of each sentence,
+and of the hypotheses of the request as a corpus. beta and
+ngram_weights can be given per request.
+
+Reference files are only registered at startup (--register), so that
+clients, which may include any web page open in a local browser,
+can not make the server read files.
+"""
+import argparse
+import asyncio
+import concurrent.futures
+import json
+import os
+import signal
+import sys
+
+from .measure import (
+    ReferenceProfile, Stats, evaluate_single, apply_ngram_weights,
+    normalize_weights)
+from .inputs import read_references
+
+# upper limit on the size of a request line
+MAX_REQUEST_BYTES = 1 << 26
+
+# connections waiting to be accepted
+BACKLOG = 1024
+
+HTTP_STATUS = {200: 'OK', 400: 'Bad Request', 405: 'Method Not Allowed'}
+
+
+class RequestError(ValueError):
+    pass
+
+
+def scores(stats, beta, ngram_weights):
+    pres, recs, fs = stats.ngram_prf(beta ** 2)
+    pre, rec, f = apply_ngram_weights(pres, recs, fs, ngram_weights)
+    return {'chrF': f, 'chrPrec': pre, 'chrRec': rec}
+
+
+def check_references(refs):
+    """The references of one line: a non-empty list of strings"""
+    if not isinstance(refs, list) or not refs \
+            or not all(isinstance(ref, str) for ref in refs):
+        raise RequestError('Each line of references must be a string '
+                           'or a non-empty list of strings')
+    return refs
+
+
+class ScoringServer(object):
+    """Registered reference sets, and the coalescing of score requests.
+    Scoring runs in a worker thread, so that the event loop
+    keeps accepting requests meanwhile."""
+    def __init__(self, max_n=6, beta=1.0, ngram_weights=None,
+                 use_space=True, refsep='*#',
+                 coalesce_delay=0.002):
+        self.max_n = max_n
+        self.beta = beta
+        self.ngram_weights = normalize_weights(ngram_weights, max_n)
+        self.use_space = use_space
+        self.refsep = refsep
+        self.coalesce_delay = coalesce_delay
+        self.reference_sets = {}
+        self.pending = []
+        self.flush_handle = None
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self.batches = 0
+
+    def register(self, set_id, references=None, path=None):
+        """Builds and stores the profiles of a reference set.
+        Returns the number of lines."""
+        if path is not None:
+            profiles = [ReferenceProfile(refs, self.max_n,
+                                         use_space=self.use_space)
+                        for refs in read_references(path,
+                                                    refsep=self.refsep)]
+        elif references is not None:
+            if not isinstance(references, list):
+                raise RequestError('references must be a list')
+            profiles = [ReferenceProfile(
+                            [refs] if isinstance(refs, str)
+                            else check_references(refs),
+                            self.max_n, use_space=self.use_space)
+                        for refs in references]
+        else:
+            raise RequestError('register needs references')
+        self.reference_sets[set_id] = profiles
+        return len(profiles)
+
+    async def handle(self, request):
+        """The response to a decoded request"""
+        if not isinstance(request, dict):
+            raise RequestError('Request must be a JSON object')
+        op = request.get('op')
+        if op == 'score':
+            return await self.score(request)
+        elif op == 'register':
+            if 'id' not in request:
+                raise RequestError('register needs an id')
+            if 'path' in request:
+                raise RequestError('Reference files can only be registered '
+                                   'at startup, with --register')
+            loop = asyncio.get_running_loop()
+            n_lines = await loop.run_in_executor(
+                self.executor, self.register, request['id'],
+                request.get('references'))
+            return {'id': request['id'], 'lines': n_lines}
+        elif op == 'unregister':
+            if self.reference_sets.pop(request.get('id'), None) is None:
+                raise RequestError(
+                    'Unknown reference set {}'.format(request.get('id')))
+            return {'id': request['id']}
+        elif op == 'list':
+            return {'reference_sets': {set_id: len(profiles)
+                    for (set_id, profiles)
+                    in sorted(self.reference_sets.items())}}
+        raise RequestError('Unknown op {}'.format(op))
+
+    async def score(self, request):
+        set_id = request.get('ref_set')
+        if set_id not in self.reference_sets:
+            raise RequestError('Unknown reference set {}'.format(set_id))
+        profiles = self.reference_sets[set_id]
+        hypotheses = request.get('hypotheses')
+        if not isinstance(hypotheses, list):
+            raise RequestError('score needs a list of hypotheses')
+        lines = request.get('lines', range(len(hypotheses)))
+        if len(lines) != len(hypotheses):
+            raise RequestError('lines and hypotheses differ in length')
+        items = []
+        for (hyp, line) in zip(hypotheses, lines):
+            if not isinstance(hyp, str):
+                raise RequestError('Hypotheses must be strings')
+            if not isinstance(line, int) or not 0 <= line < len(profiles):
+                raise RequestError(
+                    'Line {} not in reference set {}'.format(line, set_id))
+            items.append((hyp, profiles[line]))
+        beta = float(request.get('beta', self.beta))
+        if 'ngram_weights' in request:
+            ngram_weights = normalize_weights(request['ngram_weights'],
+                                              self.max_n)
+        else:
+            ngram_weights = self.ngram_weights
+
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((items, future))
+        self.schedule_flush()
+        sent_stats = await future
+
+        tot_stats = Stats(self.max_n)
+        for stats in sent_stats:
+            tot_stats += stats
+        return {'sentences': [scores(stats, beta, ngram_weights)
+                              for stats in sent_stats],
+                'corpus': scores(tot_stats, beta, ngram_weights)}
+
+    def schedule_flush(self):
+        if self.flush_handle is None:
+            loop = asyncio.get_running_loop()
+            self.flush_handle = loop.call_later(self.coalesce_delay,
+                                                self.start_flush)
+
+    def start_flush(self):
+        batch = self.pending
+        self.pending = []
+        self.flush_handle = None
+        asyncio.get_running_loop().create_task(self.flush(batch))
+
+    async def flush(self, batch):
+        """Scores the unique segments of a batch of requests.
+        A segment that fails only fails the requests containing it."""
+        unique = list(dict.fromkeys(item for (items, _) in batch
+                                    for item in items))
+        self.batches += 1
+        loop = asyncio.get_running_loop()
+        try:
+            results = await loop.run_in_executor(
+                self.executor, self.score_items, unique)
+        except Exception as e:
+            for (_, future) in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        stats_by_item = dict(zip(unique, results))
+        for (items, future) in batch:
+            if future.done():
+                continue
+            sent_stats = [stats_by_item[item] for item in items]
+            errors = [stats for stats in sent_stats
+                      if isinstance(stats, Exception)]
+            if errors:
+                future.set_exception(errors[0])
+            else:
+                future.set_result(sent_stats)
+
+    def score_items(self, items):
+        """Stats of each (hypothesis, profile),
+        or the exception raised in scoring it"""
+        results = []
+        for (hyp, profile) in items:
+            try:
+                results.append(evaluate_single(hyp, profile, self.max_n,
+                                               use_space=self.use_space,
+                                               missing=False))
+            except Exception as e:
+                results.append(e)
+        return results
+
+    async def respond(self, request_bytes):
+        """(status, response) for the raw bytes of a request"""
+        try:
+            request = json.loads(request_bytes.decode('utf-8'))
+            return (200, await self.handle(request))
+        except (RequestError, ValueError, TypeError, KeyError,
+                IOError, OSError) as e:
+            return (400, {'error': str(e)})
+
+    async def serve_lines(self, reader, writer):
+        """Connection handler for JSON lines"""
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                _, response = await self.respond(line)
+                writer.write(json.dumps(response).encode('utf-8') + b'\n')
+                await writer.drain()
+        except (ConnectionError, asyncio.LimitOverrunError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve_http(self, reader, writer):
+        """Connection handler for HTTP, one request per connection"""
+        try:
+            request_line = await reader.readline()
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+            method = request_line.split(b' ', 1)[0]
+            length = int(headers.get('content-length', 0))
+            if method != b'POST':
+                status, response = (405, {'error': 'Use POST'})
+            elif length > MAX_REQUEST_BYTES:
+                status, response = (400, {'error': 'Request too large'})
+            else:
+                status, response = await self.respond(
+                    await reader.readexactly(length))
+            body = json.dumps(response).encode('utf-8')
+            writer.write('HTTP/1.1 {} {}\r\n'
+                         'Content-Type: application/json\r\n'
+                         'Content-Length: {}\r\n'
+                         'Connection: close\r\n\r\n'.format(
+                             status, HTTP_STATUS[status],
+                             len(body)).encode('latin-1'))
+            writer.write(body)
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(server, socket_path=None, host='127.0.0.1', port=None):
+    """Serves until cancelled or terminated"""
+    if socket_path is not None:
+        listener = await asyncio.start_unix_server(
+            server.serve_lines, path=socket_path, limit=MAX_REQUEST_BYTES,
+            backlog=BACKLOG)
+        address = socket_path
+    else:
+        listener = await asyncio.start_server(
+            server.serve_http, host=host, port=port,
+            limit=MAX_REQUEST_BYTES, backlog=BACKLOG)
+        address = 'http://{}:{}'.format(host, port)
+    sys.stderr.write('chrF: serving on {}\n'.format(address))
+    sys.stderr.flush()
+    loop = asyncio.get_running_loop()
+    loop.add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        if socket_path is not None and os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+
+def get_argparser():
+    parser = argparse.ArgumentParser(
+        prog='chrF serve',
+        description='Scoring server with resident reference sets.',
+        epilog="""
+Usage examples:
+
+  %(prog)s --socket /tmp/chrF.sock --register test=ref.txt
+  %(prog)s --port 8080 -b 2.0
+
+""",
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+
+    add_arg = parser.add_argument_group(
+        'algorithm parameters').add_argument
+    add_arg('-n', '--order', type=int, default=6,
+            help='ngram order (default %(default)s).')
+    add_arg('-w', '--nweight', default=None,
+            help='comma separated ngram weights. '
+                 '(default uniform 1/n).')
+    add_arg('-b', '--beta', type=float, default=1.0,
+            help='balance parameter for f-measure. '
+                 '(default %(default)s).')
+    add_arg('--ignore-space', default=False, action='store_true',
+            help='Do not consider spaces as characters.')
+
+    add_arg = parser.add_argument_group(
+        'input options').add_argument
+    add_arg('--reference-separator', dest='refsep',
+            default='*#', metavar='SEP',
+            help='Separator for multiple references '
+                 '(default "%(default)s").')
+    add_arg('--register', default=[], action='append', metavar='ID=FILE',
+            help='Register the reference FILE as ID at startup. '
+                 'Can be repeated.')
+
+    add_arg = parser.add_argument_group(
+        'server options').add_argument
+    add_arg('--socket', default=None, metavar='PATH',
+            help='Listen on a Unix socket, for JSON lines.')
+    add_arg('--host', default='127.0.0.1',
+            help='Address to listen on for HTTP (default %(default)s).')
+    add_arg('--port', type=int, default=None,
+            help='Port to listen on for HTTP.')
+    add_arg('--coalesce-ms', type=float, default=2.0,
+            help='Time to wait for more requests before scoring a batch '
+                 '(default %(default)s).')
+
+    return parser
+
+
+def serve_main(args):
+    if (args.socket is None) == (args.port is None):
+        raise ValueError('Give either --socket or --port')
+    if args.nweight is None:
+        ngram_weights = None
+    else:
+        ngram_weights = args.nweight.split(',')
+    server = ScoringServer(max_n=args.order,
+                           beta=args.beta,
+                           ngram_weights=ngram_weights,
+                           use_space=not args.ignore_space,
+                           refsep=args.refsep,
+                           coalesce_delay=args.coalesce_ms / 1000.)
+    for spec in args.register:
+        set_id, _, path = spec.partition('=')
+        if not path:
+            raise ValueError('--register takes ID=FILE')
+        server.register(set_id, path=path)
+    try:
+        asyncio.run(serve(server, socket_path=args.socket,
+                          host=args.host, port=args.port))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
@@ -1,8 +1,15 @@
 import collections
-import itertools
 import re
+import sys
 
-from .measure import evaluate
+from .measure import (
+    Stats, score_chunks, normalize_weights, apply_ngram_weights,
+    print_single, print_summary, print_summary_table)
+from .statsfile import StatsWriter
+from .inputs import read_lines
+from .cmd import (
+    main_from_stats, make_writer, make_segment_cache, close_segment_cache,
+    get_profiler, instrumented, finish_profiler)
 
 RE_DOC = re.compile(r'<doc sysid="([^"]*)" docid="([^"]*)" [^>]*>')
 RE_SEG = re.compile(r'<seg id="([^"]*)">(.*)</seg>')
@@ -25,6 +32,23 @@ def read_sgm(lines):
             yield Segment(sysid, docid, segid, text)
 
 
+def scan_sysids(lines):
+    """The sysids of the documents, in order of first appearance"""
+    sysids = []
+    for line in lines:
+        m = RE_DOC.match(line.strip())
+        if m and m.group(1) not in sysids:
+            sysids.append(m.group(1))
+    return sysids
+
+
+def read_system(segments, sysid):
+    """The segments of one system"""
+    for seg in segments:
+        if seg.sysid == sysid:
+            yield seg
+
+
 def index_refs(segments):
     refs_by_id = collections.defaultdict(list)
     for seg in segments:
@@ -32,11 +56,173 @@ def index_refs(segments):
     return refs_by_id
 
 
-def form_pairs(hyp_segs, ref_dict):
-    hyp_segs, hyp_segs2 = itertools.tee(hyp_segs)
-    hyps = (seg.text for seg in hyp_segs)
-    refs = (ref_dict[(seg.docid, seg.segid)] for seg in hyp_segs2)
-    return hyps, refs
+class ReferenceJoin(object):
+    """Finds the references of hypothesis segments.
+
+    As long as the segments of a hypothesis system come in the same
+    doc/seg order as the references, they are merge-joined with a
+    stream over the reference file (one per reference sysid).
+    On the first mismatch, that system falls back to an index of all
+    references, which is built once and shared between systems.
+    open_refs returns a fresh iterable of the reference file lines."""
+    def __init__(self, open_refs):
+        self.open_refs = open_refs
+        self.ref_sysids = scan_sysids(open_refs())
+        self.streams = {}
+        self.index = None
+
+    def open_streams(self):
+        if len(self.ref_sysids) < 2:
+            return [read_sgm(self.open_refs())]
+        return [read_system(read_sgm(self.open_refs()), sysid)
+                for sysid in self.ref_sysids]
+
+    def references(self, seg):
+        key = (seg.docid, seg.segid)
+        if seg.sysid not in self.streams:
+            self.streams[seg.sysid] = self.open_streams()
+        streams = self.streams[seg.sysid]
+        if streams is not None:
+            refs = [next(stream, None) for stream in streams]
+            if all(ref is not None and (ref.docid, ref.segid) == key
+                   for ref in refs):
+                return [ref.text for ref in refs]
+            self.streams[seg.sysid] = None
+        if self.index is None:
+            self.index = index_refs(read_sgm(self.open_refs()))
+        if key not in self.index:
+            raise ValueError('No reference for document {} segment {}'.format(
+                *key))
+        return self.index[key]
+
+
+def score_segments(hyp_segs, join, max_n, factor, use_space=True,
+                   missing=False, jobs=1, engine='python',
+                   segment_cache=None):
+    """Yields (segment, Stats) for each hypothesis segment"""
+    # the segments read ahead of their scores
+    pending = collections.deque()
+
+    def pairs():
+        for seg in hyp_segs:
+            pending.append(seg)
+            yield (seg.text, join.references(seg))
+
+    for (_, sentences) in score_chunks(pairs(), max_n, factor,
+                                       use_space=use_space,
+                                       keep_sentences=True,
+                                       jobs=jobs,
+                                       engine=engine,
+                                       missing=missing,
+                                       segment_cache=segment_cache):
+        for sent_stats in sentences:
+            yield (pending.popleft(), sent_stats)
+
+
+def evaluate_sgm(hyp_segs,
+                 join,
+                 max_n,
+                 sysids,
+                 beta=1.0,
+                 ngram_weights=None,
+                 use_space=True,
+                 hide_precrec=False,
+                 print_missing=False,
+                 sentence_level=False,
+                 document_level=False,
+                 ngram_level=False,
+                 compatible=False,
+                 emit_stats=None,
+                 jobs=1,
+                 engine='python',
+                 profiler=None,
+                 writer=None,
+                 segment_cache=None):
+    """Scores the segments of all systems in one pass.
+    With a single system, the output is the same as that of evaluate.
+    With several, sentences are labeled with the sysid,
+    and the summary is a table with one row per system.
+    Returns a dict of the total Stats of each system."""
+    factor = beta ** 2
+    ngram_weights = normalize_weights(ngram_weights, max_n)
+    multi = len(sysids) > 1
+    n_sentences = collections.Counter()
+    sys_stats = collections.OrderedDict(
+        (sysid, Stats(max_n)) for sysid in sysids)
+    doc_stats = collections.OrderedDict()
+
+    for (seg, sent_stats) in score_segments(hyp_segs, join, max_n, factor,
+                                            use_space=use_space,
+                                            missing=print_missing,
+                                            jobs=jobs,
+                                            engine=engine,
+                                            segment_cache=segment_cache):
+        n_sentences[seg.sysid] += 1
+        if seg.sysid not in sys_stats:
+            sys_stats[seg.sysid] = Stats(max_n)
+        sys_stats[seg.sysid] += sent_stats
+        if document_level:
+            doc_key = (seg.sysid, seg.docid)
+            if doc_key not in doc_stats:
+                doc_stats[doc_key] = Stats(max_n)
+            doc_stats[doc_key] += sent_stats
+        if emit_stats is not None:
+            emit_stats.write(sent_stats)
+        if profiler is not None:
+            profiler.add_sentence(sent_stats)
+        if sentence_level and writer is not None:
+            writer.write(n_sentences[seg.sysid], sent_stats,
+                         system=seg.sysid)
+        elif sentence_level:
+            if multi:
+                label = '{}:{}'.format(seg.sysid, n_sentences[seg.sysid])
+            else:
+                label = n_sentences[seg.sysid]
+            print_single(sent_stats,
+                         label,
+                         beta,
+                         ngram_weights,
+                         print_missing=print_missing,
+                         sentence_level=sentence_level,
+                         ngram_level=ngram_level,
+                         compatible=compatible)
+
+    if document_level and writer is not None:
+        for ((sysid, docid), stats) in doc_stats.items():
+            writer.write('doc:{}'.format(docid), stats, system=sysid)
+    elif document_level:
+        print_document_table(doc_stats, beta, ngram_weights, hide_precrec)
+
+    if writer is not None:
+        for (sysid, stats) in sys_stats.items():
+            writer.write_summary(stats, system=sysid)
+    elif multi:
+        print_summary_table(list(sys_stats.keys()),
+                            list(sys_stats.values()),
+                            beta, ngram_weights,
+                            ngram_level, hide_precrec)
+    else:
+        for stats in sys_stats.values():
+            print_summary(stats, beta, ngram_weights,
+                          ngram_level, hide_precrec)
+    return sys_stats
+
+
+def print_document_table(doc_stats, beta, ngram_weights, hide_precrec=False):
+    """Document level scores, one row per system and document"""
+    factor = beta ** 2
+    header = ['system', 'document', 'chrF-{}'.format(beta)]
+    if not hide_precrec:
+        header.extend(['chrPrec', 'chrRec'])
+    sys.stdout.write('\t'.join(header) + '\n')
+    for ((sysid, docid), stats) in doc_stats.items():
+        tot_pre, tot_rec, tot_f = stats.ngram_prf(factor)
+        pre, rec, f = apply_ngram_weights(
+            tot_pre, tot_rec, tot_f, ngram_weights)
+        row = [sysid, docid, '{:.4f}'.format(f)]
+        if not hide_precrec:
+            row.extend(['{:.4f}'.format(pre), '{:.4f}'.format(rec)])
+        sys.stdout.write('\t'.join(row) + '\n')
 
 
 def sgm_main(args):
@@ -44,21 +230,57 @@ def sgm_main(args):
         ngram_weights = None
     else:
         ngram_weights = args.nweight.split(',')
+    if args.from_stats is not None:
+        return main_from_stats(args, ngram_weights)
+    if len(args.hypothesis) != 1:
+        raise ValueError('SGM evaluation takes a single hypothesis file')
+    if '-' in (args.hypothesis[0], args.reference):
+        raise ValueError('SGM files are read twice, and can not be stdin')
+    if args.shard_out is not None:
+        raise ValueError('--shard-out is not supported for SGM input')
+    sysids = scan_sysids(read_lines(args.hypothesis[0]))
+    if args.emit_stats is None:
+        emit_stats = None
+    elif len(sysids) > 1:
+        raise ValueError('--emit-stats takes a single system')
+    else:
+        emit_stats = StatsWriter(open(args.emit_stats, 'wb'),
+                                 args.order,
+                                 use_space=not args.ignore_space)
 
-    with open(args.hypothesis, 'r') as hyp_lines:
-        with open(args.reference, 'r') as ref_lines:
-            hyp_segs = read_sgm(hyp_lines)
-            ref_dict = index_refs(read_sgm(ref_lines))
-            hyps, refs = form_pairs(hyp_segs, ref_dict)
-            stats = evaluate(
-                hyps,
-                refs,
-                max_n=args.order,
-                beta=args.beta,
-                ngram_weights=ngram_weights,
-                use_space=not args.ignore_space,
-                hide_precrec=args.hide_precrec,
-                print_missing=args.missing,
-                sentence_level=args.sent_level,
-                ngram_level=args.ngram_level,
-                compatible=args.compatible)
+    # the number of segments is not known in advance, so no ETA
+    profiler = get_profiler(args, count_total=False)
+    hyp_lines = read_lines(args.hypothesis[0])
+    if profiler is not None:
+        hyp_lines = profiler.timed_iter('input', hyp_lines)
+    join = ReferenceJoin(lambda: read_lines(args.reference))
+    writer = make_writer(args, args.order, ngram_weights,
+                         systems=len(sysids) > 1)
+    segment_cache = make_segment_cache(args)
+    with instrumented(profiler):
+        stats = evaluate_sgm(
+            read_sgm(hyp_lines),
+            join,
+            args.order,
+            sysids,
+            beta=args.beta,
+            ngram_weights=ngram_weights,
+            use_space=not args.ignore_space,
+            hide_precrec=args.hide_precrec,
+            print_missing=args.missing,
+            sentence_level=args.sent_level,
+            document_level=args.doc_level,
+            ngram_level=args.ngram_level,
+            compatible=args.compatible,
+            emit_stats=emit_stats,
+            jobs=args.jobs,
+            engine=args.engine,
+            profiler=profiler,
+            writer=writer,
+            segment_cache=segment_cache)
+        if writer is not None:
+            writer.close()
+    if emit_stats is not None:
+        emit_stats.close()
+    close_segment_cache(segment_cache)
+    finish_profiler(args, profiler)
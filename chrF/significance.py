@@ -0,0 +1,294 @@
+# -*- coding: utf-8
+"""Paired significance testing between two systems.
+
+The sentence statistics of both systems are computed once.
+Each resample of the corpus is then a weighted sum of those count
+vectors, scored the same way as Stats.ngram_prf and apply_ngram_weights.
+Requires NumPy.
+"""
+import argparse
+import math
+import sys
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .measure import (
+    ReferenceProfile, evaluate_single, normalize_weights, safe_zip)
+from .statsfile import FIELDS, read_header, read_blocks
+from .vectorized import corpus_prf
+from .inputs import read_lines, read_references
+
+# upper limit on the number of sentence weights held in memory at once
+MAX_BATCH_CELLS = 10 ** 7
+
+METHODS = ('bootstrap', 'randomization')
+
+
+def require_numpy():
+    if np is None:
+        raise ImportError('Significance testing requires NumPy')
+
+
+def sentence_counts(system_lines, ref_tuples, max_n, use_space=True):
+    """Sentence statistics of several systems against the same references.
+    Returns an array of shape (n_systems, n_sentences, 4 * max_n),
+    with the counts of each sentence in the order of statsfile.FIELDS."""
+    require_numpy()
+    rows = []
+    for row in safe_zip(ref_tuples, *system_lines):
+        refs = row[0]
+        if not isinstance(refs, ReferenceProfile):
+            refs = ReferenceProfile(refs, max_n, use_space=use_space)
+        counts = []
+        for hyp_line in row[1:]:
+            stats = evaluate_single(hyp_line, refs, max_n,
+                                    use_space=use_space, missing=False)
+            counts.append([x for field in FIELDS
+                           for x in getattr(stats, field)])
+        rows.append(counts)
+    counts = np.array(rows, dtype=np.float64).reshape(
+        len(rows), len(system_lines), 4 * max_n)
+    return counts.transpose(1, 0, 2)
+
+
+def read_counts(fobj):
+    """Sentence statistics from a file written with --emit-stats.
+    Returns (max_n, use_space, counts)"""
+    require_numpy()
+    max_n, use_space = read_header(fobj)
+    blocks = [np.array(block, dtype=np.float64)
+              for block in read_blocks(fobj, max_n)]
+    if blocks:
+        counts = np.concatenate(blocks)
+    else:
+        counts = np.zeros(0)
+    return (max_n, use_space, counts.reshape(-1, 4 * max_n))
+
+
+def poisson_table(bits=16):
+    """Poisson(1) variates indexed by uniform random integers of bits,
+    with the probabilities rounded to multiples of 2 ** -bits"""
+    cdf = np.cumsum([math.exp(-1) / math.factorial(k) for k in range(20)])
+    uniform = (np.arange(1 << bits) + 0.5) / (1 << bits)
+    return np.searchsorted(cdf, uniform, side='right').astype(np.float64)
+
+
+def resampled_sums(counts_a, counts_b, method, samples, rng):
+    """Yields batches of (sums_a, sums_b) for resampled corpora"""
+    n_sentences = counts_a.shape[0]
+    batch = max(1, MAX_BATCH_CELLS // max(n_sentences, 1))
+    width = counts_a.shape[1]
+    if method == 'bootstrap':
+        # transposed, so that the sums are computed as both @ weights.T
+        both = np.ascontiguousarray(
+            np.concatenate([counts_a, counts_b], axis=1).T)
+        table = poisson_table(16)
+    if method == 'randomization':
+        diff = counts_b - counts_a
+        tot_a = counts_a.sum(axis=0)
+        tot_b = counts_b.sum(axis=0)
+    done = 0
+    while done < samples:
+        size = min(batch, samples - done)
+        if method == 'bootstrap':
+            # how many times each sentence is drawn in each resample,
+            # taking four 16-bit uniform integers from each random word
+            words = rng.integers(0, 1 << 64,
+                                 size=(size, -(-n_sentences // 4)),
+                                 dtype=np.uint64)
+            uniform = words.view(np.uint16)[:, :n_sentences]
+            sums = (both @ table[uniform].T).T
+            yield (sums[:, :width], sums[:, width:])
+        elif method == 'randomization':
+            # swap the outputs of the systems for a random half,
+            # taking eight swaps from each random byte
+            random_bytes = rng.integers(0, 256,
+                                        size=(size, (n_sentences + 7) // 8),
+                                        dtype=np.uint8)
+            swaps = np.unpackbits(random_bytes, axis=1)[:, :n_sentences]
+            moved = swaps.astype(np.float64) @ diff
+            yield (tot_a + moved, tot_b - moved)
+        else:
+            raise ValueError('Unknown method {}'.format(method))
+        done += size
+
+
+def paired_test(counts_a, counts_b, max_n, beta=2.0, ngram_weights=None,
+                method='bootstrap', samples=10000, confidence=0.95,
+                seed=None):
+    """Compares two systems, given their sentence statistics
+    as arrays of shape (n_sentences, 4 * max_n).
+
+    With method='bootstrap', the corpus is resampled with replacement,
+    approximated by drawing each sentence a Poisson(1) distributed
+    number of times (the Poisson bootstrap), which is cheaper than
+    drawing n_sentences indices. The p-value is the fraction of
+    resamples in which the difference does not have the same sign
+    as the observed one.
+    With method='randomization' (approximate randomization),
+    the outputs of the systems are swapped for a random subset of
+    sentences, and the p-value is the smoothed fraction of samples
+    with an absolute difference at least as large as the observed one.
+
+    Returns a dict with the observed scores and their difference,
+    the p-value and (for bootstrap) confidence intervals."""
+    require_numpy()
+    if counts_a.shape != counts_b.shape:
+        raise ValueError('Systems have a different number of sentences')
+    factor = beta ** 2
+    ngram_weights = normalize_weights(ngram_weights, max_n)
+    rng = np.random.default_rng(seed)
+
+    score_a = corpus_prf(counts_a.sum(axis=0), max_n,
+                         factor, ngram_weights)[2]
+    score_b = corpus_prf(counts_b.sum(axis=0), max_n,
+                         factor, ngram_weights)[2]
+    delta = score_a - score_b
+
+    scores_a = []
+    scores_b = []
+    for (sums_a, sums_b) in resampled_sums(counts_a, counts_b,
+                                           method, samples, rng):
+        scores_a.append(corpus_prf(sums_a, max_n, factor, ngram_weights)[2])
+        scores_b.append(corpus_prf(sums_b, max_n, factor, ngram_weights)[2])
+    scores_a = np.concatenate(scores_a)
+    scores_b = np.concatenate(scores_b)
+    deltas = scores_a - scores_b
+
+    result = {
+        'method': method,
+        'samples': samples,
+        'score_a': float(score_a),
+        'score_b': float(score_b),
+        'delta': float(delta),
+    }
+    if method == 'bootstrap':
+        if delta >= 0:
+            result['p_value'] = float(np.mean(deltas <= 0))
+        else:
+            result['p_value'] = float(np.mean(deltas >= 0))
+        tail = 100 * (1 - confidence) / 2
+        for (key, values) in (('a', scores_a),
+                              ('b', scores_b),
+                              ('delta', deltas)):
+            low, high = np.percentile(values, [tail, 100 - tail])
+            result['ci_' + key] = (float(low), float(high))
+    else:
+        extreme = np.sum(np.abs(deltas) >= abs(delta))
+        result['p_value'] = float((extreme + 1) / (samples + 1))
+    return result
+
+
+def get_argparser():
+    parser = argparse.ArgumentParser(
+        prog='chrF significance',
+        description='Paired significance test between two systems.',
+        epilog="""
+Usage examples:
+
+  %(prog)s sysA.txt sysB.txt ref.txt
+  %(prog)s --method randomization --from-stats sysA.stats sysB.stats
+
+""",
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+
+    add_arg = parser.add_argument
+    add_arg('files', nargs='+', metavar='FILE',
+            help='The hypothesis files of systems A and B '
+                 'followed by the reference file, '
+                 'or two stats files with --from-stats.')
+
+    add_arg = parser.add_argument_group(
+        'algorithm parameters').add_argument
+    add_arg('-n', '--order', type=int, default=6,
+            help='ngram order (default %(default)s).')
+    add_arg('-w', '--nweight', default=None,
+            help='comma separated ngram weights. '
+                 '(default uniform 1/n).')
+    add_arg('-b', '--beta', type=float, default=1.0,
+            help='balance parameter for f-measure. '
+                 '(default %(default)s).')
+    add_arg('--ignore-space', default=False, action='store_true',
+            help='Do not consider spaces as characters.')
+
+    add_arg = parser.add_argument_group(
+        'input options').add_argument
+    add_arg('--reference-separator', dest='refsep',
+            default='*#', metavar='SEP',
+            help='Separator for multiple references '
+                 '(default "%(default)s").')
+    add_arg('--from-stats', default=False, action='store_true',
+            help='The inputs are stats files written with --emit-stats.')
+
+    add_arg = parser.add_argument_group(
+        'test parameters').add_argument
+    add_arg('--method', default='bootstrap', choices=METHODS,
+            help='Paired bootstrap resampling or approximate '
+                 'randomization (default %(default)s).')
+    add_arg('--samples', type=int, default=10000,
+            help='Number of resamples (default %(default)s).')
+    add_arg('--confidence', type=float, default=0.95,
+            help='Level of the bootstrap confidence intervals '
+                 '(default %(default)s).')
+    add_arg('--seed', type=int, default=None,
+            help='Random seed.')
+
+    return parser
+
+
+def significance_main(args):
+    parser = get_argparser()
+    if args.nweight is None:
+        ngram_weights = None
+    else:
+        ngram_weights = args.nweight.split(',')
+
+    if args.from_stats:
+        if len(args.files) != 2:
+            parser.error('--from-stats takes two stats files')
+        loaded = []
+        for path in args.files:
+            with open(path, 'rb') as fobj:
+                loaded.append(read_counts(fobj))
+        if loaded[0][:2] != loaded[1][:2]:
+            parser.error('Stats files have different max_n or use_space')
+        max_n = loaded[0][0]
+        counts_a, counts_b = loaded[0][2], loaded[1][2]
+        names = args.files
+    else:
+        if len(args.files) != 3:
+            parser.error('Give two hypothesis files and a reference file')
+        max_n = args.order
+        names = args.files[:2]
+        counts_a, counts_b = sentence_counts(
+            [read_lines(args.files[0]), read_lines(args.files[1])],
+            read_references(args.files[2], refsep=args.refsep),
+            max_n,
+            use_space=not args.ignore_space)
+
+    result = paired_test(counts_a, counts_b, max_n,
+                         beta=args.beta,
+                         ngram_weights=ngram_weights,
+                         method=args.method,
+                         samples=args.samples,
+                         confidence=args.confidence,
+                         seed=args.seed)
+    print_result(result, names, args.beta, args.confidence)
+
+
+def print_result(result, names, beta, confidence):
+    rows = [(names[0], 'score_a', 'ci_a'),
+            (names[1], 'score_b', 'ci_b'),
+            ('delta', 'delta', 'ci_delta')]
+    for (name, key, ci_key) in rows:
+        sys.stdout.write('{}\tchr{}-{}\t{:.4f}'.format(
+            name, 'F', beta, result[key]))
+        if ci_key in result:
+            sys.stdout.write('\t{:g}% CI [{:.4f}, {:.4f}]'.format(
+                100 * confidence, *result[ci_key]))
+        sys.stdout.write('\n')
+    sys.stdout.write('p-value\t{}\t{:.4f}\n'.format(
+        result['method'], result['p_value']))
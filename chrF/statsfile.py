@@ -0,0 +1,143 @@
+# -*- coding: utf-8
+"""Binary files of per-sentence sufficient statistics.
+
+The file starts with a header giving max_n and use_space,
+followed by one record per sentence: the hyp_err, hyp_len, ref_err
+and ref_len counts of each n-gram order, as little-endian
+unsigned 32-bit integers.
+
+Shard files hold the summed statistics of a part of a corpus as JSON,
+with the number of sentences and optionally the line number of the
+first sentence in the whole corpus.
+"""
+import array
+import json
+import struct
+import sys
+
+from .measure import Stats
+
+MAGIC = b'chrFstat'
+VERSION = 1
+HEADER = struct.Struct('<8sHHB')
+
+SHARD_FORMAT = 'chrF-shard'
+SHARD_VERSION = 1
+
+# records written or read at a time
+BLOCK_SIZE = 4096
+
+FIELDS = ('hyp_err', 'hyp_len', 'ref_err', 'ref_len')
+
+
+def _typecode():
+    for typecode in 'IL':
+        if array.array(typecode).itemsize == 4:
+            return typecode
+    raise RuntimeError('No 32-bit array type available')
+
+TYPECODE = _typecode()
+
+
+class StatsWriter(object):
+    """Writes the Stats of each sentence to a binary file object"""
+    def __init__(self, fobj, max_n, use_space=True):
+        self.fobj = fobj
+        self.max_n = max_n
+        self.buffer = array.array(TYPECODE)
+        fobj.write(HEADER.pack(MAGIC, VERSION, max_n, bool(use_space)))
+
+    def write(self, stats):
+        for field in FIELDS:
+            self.buffer.extend(int(x) for x in getattr(stats, field))
+        if len(self.buffer) >= BLOCK_SIZE * 4 * self.max_n:
+            self.flush()
+
+    def flush(self):
+        if sys.byteorder == 'big':
+            self.buffer.byteswap()
+        self.buffer.tofile(self.fobj)
+        self.buffer = array.array(TYPECODE)
+        self.fobj.flush()
+
+    def close(self):
+        self.flush()
+        self.fobj.close()
+
+
+def read_header(fobj):
+    """Returns (max_n, use_space) from the header of a stats file"""
+    header = fobj.read(HEADER.size)
+    if len(header) != HEADER.size:
+        raise ValueError('Truncated stats file header')
+    magic, version, max_n, use_space = HEADER.unpack(header)
+    if magic != MAGIC:
+        raise ValueError('Not a chrF stats file')
+    if version != VERSION:
+        raise ValueError('Unsupported stats file version {}'.format(version))
+    return (max_n, bool(use_space))
+
+
+def read_blocks(fobj, max_n):
+    """Yields arrays holding the counts of up to BLOCK_SIZE sentences"""
+    record_bytes = 4 * 4 * max_n
+    while True:
+        data = fobj.read(BLOCK_SIZE * record_bytes)
+        if not data:
+            return
+        if len(data) % record_bytes != 0:
+            raise ValueError('Truncated stats file')
+        block = array.array(TYPECODE)
+        block.frombytes(data)
+        if sys.byteorder == 'big':
+            block.byteswap()
+        yield block
+
+
+def iter_stats(fobj, max_n):
+    """Yields the Stats of each sentence, following the header"""
+    for block in read_blocks(fobj, max_n):
+        for start in range(0, len(block), 4 * max_n):
+            yield stats_from_record(block[start:start + 4 * max_n], max_n)
+
+
+def stats_from_record(record, max_n):
+    stats = Stats(max_n)
+    for (k, field) in enumerate(FIELDS):
+        setattr(stats, field,
+                [float(x) for x in record[k * max_n:(k + 1) * max_n]])
+    return stats
+
+
+def write_shard(fobj, stats, n_sentences, use_space=True, first_line=None):
+    """Writes the summed Stats of a shard as JSON"""
+    shard = {'format': SHARD_FORMAT,
+             'version': SHARD_VERSION,
+             'max_n': stats.max_n,
+             'use_space': bool(use_space),
+             'sentences': n_sentences}
+    if first_line is not None:
+        shard['first_line'] = first_line
+    for field in FIELDS:
+        shard[field] = [int(x) for x in getattr(stats, field)]
+    json.dump(shard, fobj, sort_keys=True)
+    fobj.write('\n')
+
+
+def read_shard(fobj):
+    """Returns (shard, stats): the metadata of a shard file as a dict,
+    and its summed Stats"""
+    shard = json.load(fobj)
+    if not isinstance(shard, dict) or shard.get('format') != SHARD_FORMAT:
+        raise ValueError('Not a chrF shard file')
+    if shard.get('version') != SHARD_VERSION:
+        raise ValueError('Unsupported shard file version {}'.format(
+            shard.get('version')))
+    stats = Stats(shard['max_n'])
+    for field in FIELDS:
+        values = [float(x) for x in shard[field]]
+        if len(values) != stats.max_n:
+            raise ValueError('Shard file has {} {} values for max_n {}'.format(
+                len(values), field, stats.max_n))
+        setattr(stats, field, values)
+    return (shard, stats)
@@ -0,0 +1,197 @@
+# -*- coding: utf-8
+"""Scores for a grid of beta, n-gram order and weight settings.
+
+The text is scored once at the largest order. The Stats of lower
+orders are a prefix of those, and beta and the weights only enter
+in Stats.ngram_prf and apply_ngram_weights, so every setting of the
+grid is computed from the same Stats.
+"""
+import argparse
+import itertools
+import sys
+
+from .measure import (
+    Stats, apply_ngram_weights, normalize_weights, score_chunks, safe_zip,
+    ENGINES)
+from .statsfile import read_header, iter_stats
+from .inputs import read_lines, read_references
+
+
+def parse_floats(text):
+    return [float(x) for x in text.split(',')]
+
+
+def parse_ints(text):
+    """Comma separated integers and ranges, e.g. 1-4,6"""
+    result = []
+    for part in text.split(','):
+        first, _, last = part.partition('-')
+        result.extend(range(int(first), int(last or first) + 1))
+    return result
+
+
+def settings(orders, betas, weight_sets=()):
+    """(order, beta, label, weights) of each setting of the grid.
+    Each order is used with uniform weights and with those weight sets
+    that have one weight per n-gram order."""
+    for weights in weight_sets:
+        if len(weights) not in orders:
+            raise ValueError('Weights {} do not match any order'.format(
+                ','.join('{:g}'.format(w) for w in weights)))
+    result = []
+    for (order, beta) in itertools.product(orders, betas):
+        result.append((order, beta, 'uniform',
+                       normalize_weights(None, order)))
+        for weights in weight_sets:
+            if len(weights) == order:
+                result.append((order, beta,
+                               ','.join('{:g}'.format(w) for w in weights),
+                               normalize_weights(weights, order)))
+    return result
+
+
+def truncate(stats, max_n):
+    """The Stats of the n-gram orders up to max_n"""
+    result = Stats(max_n)
+    result.hyp_err = stats.hyp_err[:max_n]
+    result.hyp_len = stats.hyp_len[:max_n]
+    result.ref_err = stats.ref_err[:max_n]
+    result.ref_len = stats.ref_len[:max_n]
+    return result
+
+
+def sweep_scores(stats, grid):
+    """Yields (order, beta, label, chrF, chrPrec, chrRec)
+    for each setting of the grid"""
+    prfs = {}
+    for (order, beta, label, weights) in grid:
+        if beta not in prfs:
+            # the per-order values do not depend on the largest order
+            prfs[beta] = stats.ngram_prf(beta ** 2)
+        pres, recs, fs = (values[:order] for values in prfs[beta])
+        pre, rec, f = apply_ngram_weights(pres, recs, fs, weights)
+        yield (order, beta, label, f, pre, rec)
+
+
+def sweep(sentences, max_n, grid, sentence_level=False, stream=None):
+    """Writes a table of the scores of each setting of the grid,
+    for each sentence (if sentence_level) and for the corpus.
+    sentences yields the Stats of each sentence.
+    Returns the summed Stats."""
+    stream = sys.stdout if stream is None else stream
+    tot_stats = Stats(max_n)
+    stream.write('id\torder\tbeta\tweights\tchrF\tchrPrec\tchrRec\n')
+    rows = []
+    for (n_sentences, sent_stats) in enumerate(sentences, 1):
+        tot_stats += sent_stats
+        if sentence_level:
+            rows.extend(format_rows(n_sentences, sweep_scores(sent_stats,
+                                                              grid)))
+            if len(rows) >= 1000:
+                stream.write(''.join(rows))
+                rows = []
+    rows.extend(format_rows('total', sweep_scores(tot_stats, grid)))
+    stream.write(''.join(rows))
+    return tot_stats
+
+
+def format_rows(sentence_id, scores):
+    return ['{}\t{}\t{}\t{}\t{:.4f}\t{:.4f}\t{:.4f}\n'.format(
+                sentence_id, *row)
+            for row in scores]
+
+
+def get_argparser():
+    parser = argparse.ArgumentParser(
+        prog='chrF sweep',
+        description='chrF for a grid of parameter settings, '
+                    'from a single pass over the text.',
+        epilog="""
+Usage examples:
+
+  %(prog)s --betas 0.5,1,2,3 --orders 1-6 hyp.txt ref.txt
+  %(prog)s --weights 1,2,3,4 --weights 4,3,2,1 --from-stats hyp.stats
+
+""",
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+
+    add_arg = parser.add_argument
+    add_arg('files', nargs='*', metavar='FILE',
+            help='The hypothesis file and the reference file.')
+
+    add_arg = parser.add_argument_group(
+        'grid').add_argument
+    add_arg('--orders', type=parse_ints, default=[6],
+            help='Comma separated n-gram orders or ranges '
+                 '(default 6).')
+    add_arg('--betas', type=parse_floats, default=[1.0],
+            help='Comma separated values of beta (default 1.0).')
+    add_arg('--weights', type=parse_floats, default=[], action='append',
+            help='Comma separated n-gram weights, used with the order '
+                 'of the same length besides uniform weights. '
+                 'Can be repeated.')
+
+    add_arg = parser.add_argument_group(
+        'algorithm parameters').add_argument
+    add_arg('--ignore-space', default=False, action='store_true',
+            help='Do not consider spaces as characters.')
+
+    add_arg = parser.add_argument_group(
+        'input options').add_argument
+    add_arg('--reference-separator', dest='refsep',
+            default='*#', metavar='SEP',
+            help='Separator for multiple references '
+                 '(default "%(default)s").')
+    add_arg('--from-stats', default=None, metavar='FILE',
+            help='Use the sentence statistics stored with --emit-stats, '
+                 'instead of text input.')
+
+    add_arg = parser.add_argument_group(
+        'runtime options').add_argument
+    add_arg('-j', '--jobs', type=int, default=1,
+            help='Number of worker processes used for scoring '
+                 '(default %(default)s).')
+    add_arg('--engine', default='python', choices=ENGINES,
+            help='Implementation of n-gram counting and matching '
+                 '(default %(default)s).')
+
+    add_arg = parser.add_argument_group(
+        'output options').add_argument
+    add_arg('--show-sentence', dest='sent_level',
+            default=False, action='store_true',
+            help='Show sentence level scores.')
+
+    return parser
+
+
+def sweep_main(args):
+    parser = get_argparser()
+    try:
+        grid = settings(args.orders, args.betas, args.weights)
+    except ValueError as e:
+        parser.error(str(e))
+    max_n = max(args.orders)
+    if args.from_stats is not None:
+        if args.files:
+            parser.error('--from-stats does not take input files')
+        with open(args.from_stats, 'rb') as fobj:
+            file_max_n, _ = read_header(fobj)
+            if max_n > file_max_n:
+                parser.error('Stats file only has orders up to {}'.format(
+                    file_max_n))
+            sentences = (truncate(stats, max_n)
+                         for stats in iter_stats(fobj, file_max_n))
+            return sweep(sentences, max_n, grid,
+                         sentence_level=args.sent_level)
+    if len(args.files) != 2:
+        parser.error('Give a hypothesis file and a reference file')
+    pairs = safe_zip(read_lines(args.files[0]),
+                     read_references(args.files[1], refsep=args.refsep))
+    chunks = score_chunks(pairs, max_n, None,
+                          use_space=not args.ignore_space,
+                          keep_sentences=True,
+                          jobs=args.jobs,
+                          engine=args.engine)
+    sentences = itertools.chain.from_iterable(
+        sentences for (_, sentences) in chunks)
+    return sweep(sentences, max_n, grid, sentence_level=args.sent_level)
@@ -0,0 +1,76 @@
+# -*- coding: utf-8
+"""Cached segment statistics are those computed without the cache"""
+import contextlib
+import io
+import tempfile
+import unittest
+
+from chrF import cmd
+from chrF.cache import SegmentCache
+from chrF.measure import evaluate_chunk
+from chrF.tests.util import random_pairs, stats_fields
+
+
+class TestSegmentCache(unittest.TestCase):
+    def setUp(self):
+        self.pairs = random_pairs(61, n_pairs=100)
+        _, sentences = evaluate_chunk(self.pairs, 6, None, True,
+                                      keep_sentences=True)
+        self.expected = [stats_fields(stats) for stats in sentences]
+
+    def evaluate(self, cache, pairs):
+        return [stats_fields(stats)
+                for stats in cache.evaluate_chunk(pairs, 6, None)]
+
+    def test_memory(self):
+        cache = SegmentCache()
+        self.assertEqual(self.evaluate(cache, self.pairs[:60]),
+                         self.expected[:60])
+        self.assertEqual((cache.memory_hits, cache.misses), (0, 60))
+        self.assertEqual(self.evaluate(cache, self.pairs), self.expected)
+        self.assertEqual((cache.memory_hits, cache.misses), (60, 100))
+
+    def test_repeated(self):
+        cache = SegmentCache()
+        pairs = self.pairs[:10] * 3
+        self.assertEqual(self.evaluate(cache, pairs), self.expected[:10] * 3)
+        self.assertEqual((cache.memory_hits, cache.misses), (20, 10))
+
+    def test_disk(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = SegmentCache(cache_dir)
+            self.evaluate(cache, self.pairs)
+            cache.close()
+            cache = SegmentCache(cache_dir)
+            self.assertEqual(self.evaluate(cache, self.pairs), self.expected)
+            self.assertEqual(
+                (cache.disk_hits, cache.memory_hits, cache.misses),
+                (100, 0, 0))
+            # the disk hits are kept in memory
+            self.assertEqual(self.evaluate(cache, self.pairs), self.expected)
+            self.assertEqual(
+                (cache.disk_hits, cache.memory_hits, cache.misses),
+                (100, 100, 0))
+            cache.close()
+
+    def test_parameters(self):
+        cache = SegmentCache()
+        self.evaluate(cache, self.pairs)
+        _, sentences = evaluate_chunk(self.pairs, 6, None, False,
+                                      keep_sentences=True)
+        self.assertEqual(
+            [stats_fields(stats) for stats in cache.evaluate_chunk(
+                self.pairs, 6, None, use_space=False)],
+            [stats_fields(stats) for stats in sentences])
+        self.assertEqual(cache.misses, 200)
+
+    def test_jobs(self):
+        with contextlib.redirect_stderr(io.StringIO()) as stderr:
+            with self.assertRaises(SystemExit):
+                cmd.parse_args(['--segment-cache', 'cache', '-j', '2',
+                                'hyp', 'ref'])
+        self.assertIn('without --jobs', stderr.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
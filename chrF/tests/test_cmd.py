@@ -0,0 +1,23 @@
+# -*- coding: utf-8
+"""Command lines parsed without argparse are parsed as with it"""
+import unittest
+
+from chrF import cmd
+
+
+class TestPlainArgs(unittest.TestCase):
+    def test_defaults(self):
+        for argv in (['hyp', 'ref'],
+                     ['hyp1', 'hyp2', 'hyp3', 'ref'],
+                     ['--server-stdin']):
+            self.assertEqual(vars(cmd.plain_args(argv)),
+                             vars(cmd.parse_args(argv)))
+
+    def test_options(self):
+        for argv in ([], ['ref'], ['-', 'ref'], ['hyp', 'ref', '-n', '4'],
+                     ['--server-stdin', '--raw-counts'], ['-h']):
+            self.assertIsNone(cmd.plain_args(argv))
+
+
+if __name__ == '__main__':
+    unittest.main()
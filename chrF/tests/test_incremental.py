@@ -0,0 +1,46 @@
+# -*- coding: utf-8
+"""Editing a hypothesis in place gives the Stats of scoring it anew"""
+import random
+import unittest
+
+from chrF.measure import IncrementalScorer, evaluate_single
+from chrF.tests.util import random_line, random_pairs, stats_fields
+
+
+class TestIncremental(unittest.TestCase):
+    def check_edits(self, seed, max_n, use_space):
+        rng = random.Random(seed)
+        for (hyp, refs) in random_pairs(seed, n_pairs=30):
+            scorer = IncrementalScorer(hyp, refs, max_n=max_n,
+                                       use_space=use_space)
+            for _ in range(10):
+                start = rng.randint(0, len(hyp))
+                end = rng.randint(start, len(hyp))
+                text = random_line(rng, max_len=5)
+                scorer.replace(start, end, text)
+                hyp = hyp[:start] + text + hyp[end:]
+                self.assertEqual(scorer.hypothesis, hyp)
+                self.assertEqual(
+                    stats_fields(scorer.stats()),
+                    stats_fields(evaluate_single(hyp, refs, max_n,
+                                                 use_space=use_space,
+                                                 missing=False)))
+
+    def test_replace(self):
+        self.check_edits(41, 6, True)
+
+    def test_ignore_space(self):
+        self.check_edits(42, 6, False)
+
+    def test_orders(self):
+        for max_n in (1, 2, 10):
+            self.check_edits(43 + max_n, max_n, True)
+
+    def test_invalid_span(self):
+        scorer = IncrementalScorer('a b', ['a c'])
+        with self.assertRaises(ValueError):
+            scorer.replace(2, 1, 'x')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+# -*- coding: utf-8
+"""Reference pruning gives the same results as matching every reference,
+and counting in blocks the same counts as counting at once"""
+import collections
+import unittest
+
+from chrF.measure import (
+    IncrementalScorer, ReferenceProfile, Stats, block_counts, chrf,
+    errors_multiref, errors_n, errors_profile, evaluate_single, ngram_lists,
+    ngrams_up_to, prepare_line)
+from chrF.tests.util import random_pairs, stats_fields
+
+
+def unpruned_errors(hypothesis, references, max_n, use_space=True):
+    """errors_multiref without pruning: errors_n against every reference"""
+    hyp_ngrams = ngrams_up_to(hypothesis, max_n, use_space=use_space)
+    ref_ngrams = zip(*(ngrams_up_to(line, max_n, use_space=use_space)
+                       for line in references))
+    for (i, (hyp, refs)) in enumerate(zip(hyp_ngrams, ref_ngrams)):
+        best_hyp_error = min((errors_n(hyp, ref) for ref in refs),
+                             key=lambda x: x.precrec)
+        best_ref_error = min((errors_n(ref, hyp) for ref in refs),
+                             key=lambda x: x.precrec)
+        yield (i, best_hyp_error, best_ref_error)
+
+
+def unpruned_stats(hypothesis, references, max_n, use_space=True):
+    stats = Stats(max_n)
+    for (i, hyp_error, ref_error) in unpruned_errors(
+            hypothesis, references, max_n, use_space=use_space):
+        stats.hyp_err[i] = hyp_error.count
+        stats.hyp_len[i] = hyp_error.hyplen
+        stats.ref_err[i] = ref_error.count
+        stats.ref_len[i] = ref_error.hyplen
+    return stats
+
+
+class TestPruning(unittest.TestCase):
+    def check_pairs(self, pairs, max_n, use_space):
+        for (hyp, refs) in pairs:
+            expected = list(unpruned_errors(hyp, refs, max_n,
+                                            use_space=use_space))
+            self.assertEqual(
+                list(errors_multiref(hyp, refs, max_n,
+                                     use_space=use_space)),
+                expected)
+            # the profile keeps the missing n-grams of the best reference
+            profile = ReferenceProfile(refs, max_n, use_space=use_space)
+            self.assertEqual(
+                [(i, hyp_error[:2], ref_error[:2])
+                 for (i, hyp_error, ref_error) in errors_profile(
+                     hyp, profile, max_n, use_space=use_space)],
+                [(i, hyp_error[:2], ref_error[:2])
+                 for (i, hyp_error, ref_error) in expected])
+            unpruned = stats_fields(unpruned_stats(hyp, refs, max_n,
+                                                   use_space=use_space))
+            for references in (refs, profile):
+                self.assertEqual(
+                    stats_fields(evaluate_single(hyp, references, max_n,
+                                                 use_space=use_space,
+                                                 missing=False)),
+                    unpruned)
+
+    def test_ties(self):
+        self.check_pairs(random_pairs(1), 6, True)
+
+    def test_ignore_space(self):
+        self.check_pairs(random_pairs(2), 6, False)
+
+    def test_orders(self):
+        for max_n in (1, 2, 10):
+            self.check_pairs(random_pairs(3 + max_n, n_pairs=50), max_n, True)
+
+    def test_long_lines(self):
+        self.check_pairs(random_pairs(4, n_pairs=50, alphabet='abcde f',
+                                      max_len=300), 6, True)
+
+    def test_no_references(self):
+        zero = stats_fields(Stats(6))
+        for references in ([], ReferenceProfile([], 6)):
+            for missing in (False, True):
+                self.assertEqual(
+                    stats_fields(evaluate_single('a b', references, 6,
+                                                 missing=missing)),
+                    zero)
+        self.assertEqual(chrf('a b', []), 0.)
+        self.assertEqual(stats_fields(IncrementalScorer('a b', []).stats()),
+                         zero)
+
+
+class TestBlockCounts(unittest.TestCase):
+    def test_block_sizes(self):
+        for (hyp, refs) in random_pairs(5, n_pairs=30, max_len=100):
+            for line in [hyp] + refs:
+                line = prepare_line(line)
+                for max_n in (1, 3, 6):
+                    expected = [collections.Counter(grams)
+                                for grams in ngram_lists(line, max_n)]
+                    # blocks shorter than, equal to and longer than max_n
+                    for block_size in (1, 2, 3, 6, 7, 1000):
+                        self.assertEqual(
+                            block_counts(line, max_n, block_size=block_size),
+                            expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
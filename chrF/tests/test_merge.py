@@ -0,0 +1,48 @@
+# -*- coding: utf-8
+"""Scoring a corpus in shards and merging them gives the unsharded Stats"""
+import io
+import unittest
+
+from chrF.measure import evaluate_chunk
+from chrF.merge import merge_shards
+from chrF.statsfile import read_shard, write_shard
+from chrF.tests.util import random_pairs, stats_fields
+
+
+def shard(pairs, first_line, max_n=6, use_space=True):
+    stats, _ = evaluate_chunk(pairs, max_n, None, use_space,
+                              keep_sentences=False)
+    fobj = io.StringIO()
+    write_shard(fobj, stats, len(pairs), use_space=use_space,
+                first_line=first_line)
+    fobj.seek(0)
+    return read_shard(fobj)
+
+
+class TestMerge(unittest.TestCase):
+    def test_split_and_merge(self):
+        pairs = random_pairs(21, n_pairs=300)
+        expected, _ = evaluate_chunk(pairs, 6, None, True,
+                                     keep_sentences=False)
+        splits = [0, 7, 150, 151, 300]
+        shards = [shard(pairs[start:end], start)
+                  for (start, end) in zip(splits, splits[1:])]
+        # the order of the shard files does not matter
+        max_n, use_space, n_sentences, stats = merge_shards(shards[::-1])
+        self.assertEqual((max_n, use_space, n_sentences), (6, True, 300))
+        self.assertEqual(stats_fields(stats), stats_fields(expected))
+
+    def test_overlap(self):
+        pairs = random_pairs(22, n_pairs=20)
+        with self.assertRaises(ValueError):
+            merge_shards([shard(pairs[:12], 0), shard(pairs[10:], 10)])
+
+    def test_parameters(self):
+        pairs = random_pairs(23, n_pairs=20)
+        with self.assertRaises(ValueError):
+            merge_shards([shard(pairs[:10], 0),
+                          shard(pairs[10:], 10, use_space=False)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+# -*- coding: utf-8
+"""A bad request fails on its own, not with the batch it was coalesced in"""
+import asyncio
+import json
+import unittest
+
+from chrF.measure import (
+    ReferenceProfile, evaluate_single, normalize_weights)
+from chrF.server import ScoringServer, scores
+
+
+def request(server, **kwargs):
+    return server.respond(json.dumps(kwargs).encode('utf-8'))
+
+
+class TestServer(unittest.TestCase):
+    def run_requests(self, *requests):
+        async def run():
+            server = ScoringServer(max_n=6)
+            server.register('good', references=[['a b c', 'a b'], 'd e'])
+            # profiles of another order fail in scoring
+            server.reference_sets['bad'] = [ReferenceProfile(['a b'], 4)]
+            return await asyncio.gather(
+                *(request(server, **kwargs) for kwargs in requests))
+        return asyncio.run(run())
+
+    def test_register(self):
+        for references in ([[]], [['a', 1]], [None], 'a b'):
+            ((status, response),) = self.run_requests(
+                dict(op='register', id='new', references=references))
+            self.assertEqual(status, 400)
+            self.assertIn('references', response['error'])
+
+    def test_coalesced(self):
+        good, bad = self.run_requests(
+            dict(op='score', ref_set='good', hypotheses=['a b', 'd']),
+            dict(op='score', ref_set='bad', hypotheses=['a b']))
+        self.assertEqual(bad[0], 400)
+        self.assertEqual(good[0], 200)
+        self.assertEqual(
+            good[1]['sentences'],
+            [scores(evaluate_single(hyp, refs, 6), 1.,
+                    normalize_weights(None, 6))
+             for (hyp, refs) in (('a b', ['a b c', 'a b']),
+                                 ('d', ['d e']))])
+
+
+if __name__ == '__main__':
+    unittest.main()
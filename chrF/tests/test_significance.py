@@ -0,0 +1,43 @@
+# -*- coding: utf-8
+"""The Poisson bootstrap draws sentences as often as resampling would"""
+import math
+import unittest
+
+from chrF.significance import np, paired_test, poisson_table, sentence_counts
+from chrF.tests.util import random_pairs
+
+
+@unittest.skipIf(np is None, 'NumPy is not installed')
+class TestBootstrap(unittest.TestCase):
+    def test_table(self):
+        table = poisson_table(16)
+        counts = np.bincount(table.astype(np.int64))
+        for (k, count) in enumerate(counts):
+            expected = math.exp(-1) / math.factorial(k)
+            self.assertLessEqual(abs(count / len(table) - expected), 2 ** -16)
+        self.assertAlmostEqual(table.mean(), 1., places=4)
+
+    def test_paired(self):
+        pairs = random_pairs(71, n_pairs=300)
+        # the second system is the first with the last word dropped
+        systems = [[hyp for (hyp, _) in pairs],
+                   [hyp.rsplit(' ', 1)[0] for (hyp, _) in pairs]]
+        counts_a, counts_b = sentence_counts(
+            systems, [refs for (_, refs) in pairs], 6)
+        result = paired_test(counts_a, counts_b, 6, samples=1000, seed=1)
+        self.assertEqual(result['score_a'] - result['score_b'],
+                         result['delta'])
+        for (key, observed) in (('a', result['score_a']),
+                                ('b', result['score_b']),
+                                ('delta', result['delta'])):
+            low, high = result['ci_' + key]
+            self.assertLess(low, observed)
+            self.assertLess(observed, high)
+        # the same resamples with the same seed
+        self.assertEqual(paired_test(counts_a, counts_b, 6, samples=1000,
+                                     seed=1),
+                         result)
+
+
+if __name__ == '__main__':
+    unittest.main()
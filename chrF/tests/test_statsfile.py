@@ -0,0 +1,45 @@
+# -*- coding: utf-8
+"""Scores from the stored sentence statistics are those of the text"""
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+
+from chrF import cmd
+from chrF.tests.util import random_pairs
+
+
+def run(argv):
+    stream = io.StringIO()
+    with contextlib.redirect_stdout(stream):
+        cmd.main(cmd.parse_args(argv))
+    return stream.getvalue()
+
+
+class TestStatsFile(unittest.TestCase):
+    def test_round_trip(self):
+        pairs = random_pairs(51, n_pairs=300, max_refs=1)
+        with tempfile.TemporaryDirectory() as tmp:
+            hyp_path = os.path.join(tmp, 'hyp')
+            ref_path = os.path.join(tmp, 'ref')
+            stats_path = os.path.join(tmp, 'stats')
+            with open(hyp_path, 'w') as fobj:
+                fobj.writelines(hyp + '\n' for (hyp, _) in pairs)
+            with open(ref_path, 'w') as fobj:
+                fobj.writelines(refs[0] + '\n' for (_, refs) in pairs)
+            for options in ([], ['-n', '3', '--ignore-space']):
+                shown = options + ['--show-sentence', '--show-ngram']
+                expected = run(shown + [hyp_path, ref_path])
+                emitted = run(shown + ['--emit-stats', stats_path,
+                                       hyp_path, ref_path])
+                self.assertEqual(emitted, expected)
+                # max_n and use_space are read from the file
+                self.assertEqual(
+                    run(['--show-sentence', '--show-ngram',
+                         '--from-stats', stats_path]),
+                    expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
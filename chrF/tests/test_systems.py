@@ -0,0 +1,72 @@
+# -*- coding: utf-8
+"""Several systems and SGM input show missing n-grams with every engine"""
+import contextlib
+import io
+import unittest
+
+from chrF import vectorized
+from chrF.measure import evaluate_systems
+from chrF.sgm import ReferenceJoin, evaluate_sgm, read_sgm
+from chrF.tests.util import random_pairs
+
+
+def sgm_lines(setid, sysid, lines):
+    yield '<tstset setid="{}" srclang="a" trglang="b">'.format(setid)
+    yield '<doc sysid="{}" docid="doc0" genre="x">'.format(sysid)
+    for (i, line) in enumerate(lines):
+        yield '<seg id="{}">{}</seg>'.format(i + 1, line)
+    yield '</doc>'
+    yield '</tstset>'
+
+
+def printed(func, *args, **kwargs):
+    stream = io.StringIO()
+    with contextlib.redirect_stdout(stream):
+        func(*args, **kwargs)
+    return stream.getvalue()
+
+
+@unittest.skipIf(vectorized.np is None, 'NumPy is not installed')
+class TestMissing(unittest.TestCase):
+    def setUp(self):
+        pairs = random_pairs(31, n_pairs=20, max_refs=1)
+        self.hyps = [hyp for (hyp, _) in pairs]
+        self.refs = [refs[0] for (_, refs) in pairs]
+
+    def check_engines(self, score):
+        python = score('python')
+        # not only empty lists of missing n-grams
+        self.assertRegex(python, r'::ref-1grams: \S')
+        self.assertEqual(score('numpy'), python)
+        self.assertEqual(score('python', jobs=2), python)
+
+    def test_systems(self):
+        def score(engine, jobs=1):
+            return printed(evaluate_systems,
+                           [self.hyps, self.hyps[::-1]],
+                           [[ref] for ref in self.refs],
+                           6,
+                           print_missing=True,
+                           sentence_level=True,
+                           engine=engine,
+                           jobs=jobs)
+        self.check_engines(score)
+
+    def test_sgm(self):
+        ref_lines = list(sgm_lines('t', 'ref', self.refs))
+
+        def score(engine, jobs=1):
+            return printed(evaluate_sgm,
+                           read_sgm(sgm_lines('t', 'A', self.hyps)),
+                           ReferenceJoin(lambda: iter(ref_lines)),
+                           6,
+                           ['A'],
+                           print_missing=True,
+                           sentence_level=True,
+                           engine=engine,
+                           jobs=jobs)
+        self.check_engines(score)
+
+
+if __name__ == '__main__':
+    unittest.main()
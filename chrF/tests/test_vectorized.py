@@ -0,0 +1,60 @@
+# -*- coding: utf-8
+"""The numpy engine gives the same Stats as the python engine"""
+import unittest
+
+from chrF.measure import chrf_matrix, evaluate_chunk
+from chrF import vectorized
+from chrF.tests.util import random_pairs, stats_fields
+
+
+@unittest.skipIf(vectorized.np is None, 'NumPy is not installed')
+class TestEngines(unittest.TestCase):
+    def check_pairs(self, pairs, max_n, use_space=True):
+        results = [evaluate_chunk(pairs, max_n, None, use_space,
+                                  keep_sentences=True, engine=engine)
+                   for engine in ('python', 'numpy')]
+        (python_total, python_sentences), (numpy_total, numpy_sentences) = \
+            results
+        self.assertEqual([stats_fields(stats) for stats in numpy_sentences],
+                         [stats_fields(stats) for stats in python_sentences])
+        self.assertEqual(stats_fields(numpy_total),
+                         stats_fields(python_total))
+
+    def test_ties(self):
+        self.check_pairs(random_pairs(11), 6)
+
+    def test_ignore_space(self):
+        self.check_pairs(random_pairs(12), 6, use_space=False)
+
+    def test_orders(self):
+        for max_n in (1, 2, 10):
+            self.check_pairs(random_pairs(13 + max_n, n_pairs=50), max_n)
+
+    def test_large_alphabet(self):
+        # the n-gram keys have to be renumbered to not overflow
+        alphabet = [chr(0x4e00 + i) for i in range(5000)] + [' ']
+        self.check_pairs(random_pairs(14, n_pairs=50, alphabet=alphabet),
+                         10)
+
+    def test_no_references(self):
+        pairs = random_pairs(16, n_pairs=50)
+        self.check_pairs([(hyp, refs if i % 3 else [])
+                          for (i, (hyp, refs)) in enumerate(pairs)], 6)
+        self.check_pairs([(hyp, []) for (hyp, _) in pairs[:5]], 6)
+
+    def test_chrf_matrix(self):
+        candidates = [hyp for (hyp, _) in random_pairs(15, n_pairs=30)]
+        for references in (None, candidates[:10]):
+            expected = chrf_matrix(candidates, references, engine='python')
+            # the same list of rows with every engine
+            for engine in ('numpy', None):
+                self.assertEqual(
+                    chrf_matrix(candidates, references, engine=engine),
+                    expected)
+            self.assertEqual(
+                vectorized.chrf_matrix(candidates, references).tolist(),
+                expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,23 @@
+# -*- coding: utf-8
+"""Random segments for the tests"""
+import random
+
+
+def random_line(rng, alphabet='ab c', max_len=30):
+    """A line over a small alphabet, so that n-grams repeat
+    and references often tie"""
+    return ''.join(rng.choice(alphabet)
+                   for _ in range(rng.randint(0, max_len)))
+
+
+def random_pairs(seed, n_pairs=200, max_refs=4, **kwargs):
+    """(hypothesis, references) pairs"""
+    rng = random.Random(seed)
+    return [(random_line(rng, **kwargs),
+             [random_line(rng, **kwargs)
+              for _ in range(rng.randint(1, max_refs))])
+            for _ in range(n_pairs)]
+
+
+def stats_fields(stats):
+    return (stats.hyp_err, stats.hyp_len, stats.ref_err, stats.ref_len)
@@ -0,0 +1,303 @@
+# -*- coding: utf-8
+"""NumPy implementation of n-gram counting and clipped matching.
+
+All lines of a batch (hypotheses and their references) are encoded
+into a single array of codepoints. The n-grams of each order are
+identified by integer keys, extended from the keys of the previous order
+by the following character. The keys are exact: they are only
+renumbered (which takes a sort) when the next extension could overflow,
+so that each order usually takes a single sort, to count the n-grams of
+each line. Clipped match counts are computed with searchsorted instead
+of Counters, and the best references are selected for all segments
+at once. Missing n-grams are not collected.
+
+For the overlaps of all pairs of lines, the clipped count
+min(a, b) is computed as the sum over thresholds t of [a >= t][b >= t],
+so that each threshold is a product of binary matrices.
+"""
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .measure import (
+    ReferenceProfile, Stats, prepare_line, normalize_weights)
+
+# n-gram columns of the binary matrices multiplied at a time
+MATRIX_BLOCK = 4096
+
+
+def require_numpy():
+    if np is None:
+        raise ImportError('The numpy engine requires NumPy')
+
+
+def encode(lines, use_space=True):
+    """Codepoints of all lines concatenated, and the length of each line"""
+    encoded = [prepare_line(line, use_space=use_space).encode('utf-32-le')
+               for line in lines]
+    lengths = np.array([len(enc) // 4 for enc in encoded], dtype=np.int64)
+    codepoints = np.frombuffer(b''.join(encoded), dtype='<u4')
+    return codepoints, lengths
+
+
+def ngram_count_tables(texts, max_n, use_space=True):
+    """The n-gram counts of each line.
+    Returns (line_lens, orders), where orders yields for each order
+    (lines, keys, counts, n_keys): the count of each distinct
+    n-gram key, below n_keys (but not all keys are used), in each line.
+    line * n_keys + key does not overflow."""
+    require_numpy()
+    codepoints, line_lens = encode(texts, use_space=use_space)
+    return line_lens, _count_orders(codepoints, line_lens, max_n)
+
+
+def _count_orders(codepoints, line_lens, max_n):
+    n_lines = len(line_lens)
+    line_of = np.repeat(np.arange(n_lines, dtype=np.int64), line_lens)
+    # characters from each position to the end of its line
+    remaining = (np.cumsum(line_lens)[line_of]
+                 - np.arange(len(codepoints), dtype=np.int64))
+
+    alphabet, chars = np.unique(codepoints, return_inverse=True)
+    chars = chars.astype(np.int64)
+    n_chars = max(len(alphabet), 1)
+    # line * n_keys + key must stay below 2 ** 62
+    limit = (1 << 62) // max(n_lines, 1)
+
+    # the n-grams starting at positions, and their keys
+    positions = np.arange(len(codepoints), dtype=np.int64)
+    keys = chars
+    n_keys = n_chars
+    for i in range(max_n):
+        n = i + 1
+        if n > 1:
+            fits = remaining[positions] >= n
+            positions = positions[fits]
+            keys = keys[fits]
+            if n_keys * n_chars >= limit:
+                uniq, keys = np.unique(keys, return_inverse=True)
+                n_keys = max(len(uniq), 1)
+            keys = keys * n_chars + chars[positions + i]
+            n_keys *= n_chars
+        codes, counts = np.unique(line_of[positions] * n_keys + keys,
+                                  return_counts=True)
+        yield (codes // n_keys, codes % n_keys, counts, n_keys)
+
+
+def batch_matches(lines, max_n, use_space=True):
+    """Per-order n-gram counts of lines, matched within groups.
+    lines is a sequence of (group, is_hypothesis, text), where each group
+    consists of one hypothesis and its references, in increasing group order.
+    Returns (lengths, matches), both arrays of shape (max_n, len(lines)).
+    For a reference line, matches is the clipped count of n-grams
+    shared with the hypothesis of the group."""
+    require_numpy()
+    groups = np.array([group for (group, _, _) in lines], dtype=np.int64)
+    is_hyp = np.array([hyp for (_, hyp, _) in lines], dtype=bool)
+    line_lens, orders = ngram_count_tables(
+        [text for (_, _, text) in lines], max_n, use_space=use_space)
+    n_lines = len(line_lens)
+
+    lengths = np.zeros((max_n, n_lines), dtype=np.int64)
+    matches = np.zeros((max_n, n_lines), dtype=np.int64)
+    for (i, (code_lines, keys, counts, n_keys)) in enumerate(orders):
+        lengths[i] = np.maximum(line_lens - i, 0)
+        group_codes = groups[code_lines] * n_keys + keys
+        hyp_mask = is_hyp[code_lines]
+        # hypothesis lines are in group order, so their codes are sorted
+        hyp_codes = group_codes[hyp_mask]
+        hyp_counts = counts[hyp_mask]
+        ref_codes = group_codes[~hyp_mask]
+        idx = np.searchsorted(hyp_codes, ref_codes)
+        idx = np.minimum(idx, max(len(hyp_codes) - 1, 0))
+        if len(hyp_codes) > 0:
+            found = hyp_codes[idx] == ref_codes
+            clipped = np.where(found,
+                               np.minimum(counts[~hyp_mask], hyp_counts[idx]),
+                               0)
+        else:
+            clipped = np.zeros(len(ref_codes), dtype=np.int64)
+        matches[i] = np.bincount(code_lines[~hyp_mask],
+                                 weights=clipped,
+                                 minlength=n_lines).astype(np.int64)
+    return lengths, matches
+
+
+def evaluate_batch(pairs, max_n, use_space=True):
+    """Stats of each (hypothesis, references) pair,
+    identical to those of evaluate_single."""
+    lines = []
+    n_refs = []
+    has_refs = []
+    for (hyp_line, refs) in pairs:
+        if isinstance(refs, ReferenceProfile):
+            refs.check(max_n, use_space)
+            refs = refs.references
+        has_refs.append(len(refs) > 0)
+        if not refs:
+            # zero stats, as from evaluate_single
+            continue
+        group = len(n_refs)
+        lines.append((group, True, hyp_line))
+        lines.extend((group, False, ref) for ref in refs)
+        n_refs.append(len(refs))
+    if not lines:
+        return [Stats(max_n) for _ in has_refs]
+    n_refs = np.array(n_refs, dtype=np.int64)
+    lengths, matches = batch_matches(lines, max_n, use_space=use_space)
+    is_hyp = np.array([hyp for (_, hyp, _) in lines], dtype=bool)
+    hyp_lens = lengths[:, is_hyp]
+    ref_lens = lengths[:, ~is_hyp]
+    ref_matches = matches[:, ~is_hyp]
+    best_hyp, best_ref = best_references(hyp_lens, ref_lens, ref_matches,
+                                         n_refs)
+
+    hyp_err = (hyp_lens - take_rows(ref_matches, best_hyp)).astype(float)
+    ref_len = take_rows(ref_lens, best_ref)
+    ref_err = (ref_len - take_rows(ref_matches, best_ref)).astype(float)
+    values = zip(hyp_err.T.tolist(), hyp_lens.T.tolist(),
+                 ref_err.T.tolist(), ref_len.T.tolist())
+    result = []
+    for scored in has_refs:
+        stats = Stats(max_n)
+        if scored:
+            (stats.hyp_err, stats.hyp_len,
+             stats.ref_err, stats.ref_len) = next(values)
+        result.append(stats)
+    return result
+
+
+def take_rows(values, indices):
+    """values[i, indices[i, j]] for each order i and segment j"""
+    return np.take_along_axis(values, indices, axis=1)
+
+
+def best_references(hyp_lens, ref_lens, ref_matches, n_refs):
+    """measure.select_references for every order and segment.
+    hyp_lens has shape (max_n, segments), ref_lens and ref_matches
+    (max_n, references), where the references of each segment are
+    consecutive, n_refs per segment. Returns (best_hyp, best_ref),
+    the columns of the selected references, of shape (max_n, segments)."""
+    ref_group = np.repeat(np.arange(len(n_refs)), n_refs)
+    first_refs = np.cumsum(n_refs) - n_refs
+    hyp_lens = hyp_lens[:, ref_group]
+    best = []
+    for (length, other_length) in ((hyp_lens, ref_lens),
+                                   (ref_lens, hyp_lens)):
+        # as measure.error_rate, in the same floating point operations
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rate = np.where(length != 0,
+                            100. * (length - ref_matches) / length,
+                            np.where(other_length != 0, 100., 0.))
+        lowest = np.minimum.reduceat(rate, first_refs, axis=1)
+        # the first reference with the lowest rate, as with min
+        columns = np.where(rate == lowest[:, ref_group],
+                           np.arange(rate.shape[1]), rate.shape[1])
+        best.append(np.minimum.reduceat(columns, first_refs, axis=1))
+    return tuple(best)
+
+
+def overlap_matrices(hyp_lines, ref_lines, max_n, use_space=True):
+    """Clipped n-gram overlaps of every hypothesis with every reference.
+    If ref_lines is None, the hypotheses are matched against each other,
+    and the symmetric overlaps are computed once.
+    Returns (hyp_lens, ref_lens, overlaps), of shapes
+    (max_n, K), (max_n, R) and (max_n, K, R)."""
+    hyp_lines = list(hyp_lines)
+    same = ref_lines is None
+    texts = hyp_lines if same else hyp_lines + list(ref_lines)
+    n_hyps = len(hyp_lines)
+    n_refs = len(texts) - (0 if same else n_hyps)
+    line_lens, orders = ngram_count_tables(texts, max_n, use_space=use_space)
+    lengths = np.maximum(line_lens[None, :] - np.arange(max_n)[:, None], 0)
+    overlaps = np.zeros((max_n, n_hyps, n_refs), dtype=np.int64)
+    for (i, (lines, keys, counts, _)) in enumerate(orders):
+        # numbered from 0, for bincount
+        uniq, keys = np.unique(keys, return_inverse=True)
+        n_keys = len(uniq)
+        is_hyp = lines < n_hyps
+        # only n-grams on both sides (or in two lines) can match
+        if same:
+            shared = np.bincount(keys, minlength=n_keys) > 1
+        else:
+            shared = ((np.bincount(keys[is_hyp], minlength=n_keys) > 0) &
+                      (np.bincount(keys[~is_hyp], minlength=n_keys) > 0))
+        keep = shared[keys]
+        lines, keys, counts = lines[keep], keys[keep], counts[keep]
+        threshold = 1
+        while len(keys) > 0:
+            overlaps[i] += binary_products(lines, keys, n_hyps, len(texts),
+                                           same)
+            threshold += 1
+            keep = counts >= threshold
+            lines, keys, counts = lines[keep], keys[keep], counts[keep]
+        if same:
+            # the overlap of a line with itself is its n-gram count
+            np.fill_diagonal(overlaps[i], lengths[i])
+    if same:
+        return lengths, lengths, overlaps
+    return lengths[:, :n_hyps], lengths[:, n_hyps:], overlaps
+
+
+def binary_products(lines, keys, n_hyps, n_lines, same):
+    """Number of keys shared by each hypothesis and reference line"""
+    columns, keys = np.unique(keys, return_inverse=True)
+    result = np.zeros((n_hyps, n_lines - (0 if same else n_hyps)),
+                      dtype=np.int64)
+    order = np.argsort(keys, kind='stable')
+    lines, keys = lines[order], keys[order]
+    bounds = np.searchsorted(keys, np.arange(0, len(columns) + MATRIX_BLOCK,
+                                             MATRIX_BLOCK))
+    for (start, end) in zip(bounds[:-1], bounds[1:]):
+        if start == end:
+            continue
+        block_keys = keys[start:end]
+        first = block_keys[0]
+        width = block_keys[-1] - first + 1
+        present = np.zeros((n_lines, width), dtype=np.float32)
+        present[lines[start:end], block_keys - first] = 1
+        hyps = present[:n_hyps]
+        refs = hyps if same else present[n_hyps:]
+        result += (hyps @ refs.T).astype(np.int64)
+    return result
+
+
+def chrf_matrix(candidates, references=None, max_n=6, beta=2.0,
+                ngram_weights=None, use_space=True):
+    """NumPy version of measure.chrf_matrix. Returns a K x R array."""
+    require_numpy()
+    hyp_lens, ref_lens, overlaps = overlap_matrices(
+        candidates, references, max_n, use_space=use_space)
+    hyp_lens = hyp_lens[:, :, None]
+    ref_lens = ref_lens[:, None, :]
+    hyp_err = (hyp_lens - overlaps).astype(np.float64)
+    ref_err = (ref_lens - overlaps).astype(np.float64)
+    sums = np.concatenate(np.broadcast_arrays(
+        hyp_err, hyp_lens, ref_err, ref_lens)).astype(np.float64)
+    # shape (K, R, 4 * max_n) as expected by corpus_prf
+    sums = sums.transpose(1, 2, 0)
+    return corpus_prf(sums, max_n, beta ** 2,
+                      normalize_weights(ngram_weights, max_n))[2]
+
+
+def corpus_prf(sums, max_n, factor, ngram_weights):
+    """Vectorized Stats.ngram_prf and apply_ngram_weights.
+    sums has shape (..., 4 * max_n). Returns (pre, rec, f),
+    each of shape sums.shape[:-1]."""
+    hyp_err, hyp_len, ref_err, ref_len = (
+        sums[..., k * max_n:(k + 1) * max_n] for k in range(4))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pre = np.where(hyp_len > 0, 100 - (100 * (hyp_err / hyp_len)), 0)
+        rec = np.where(ref_len > 0, 100 - (100 * (ref_err / ref_len)), 0)
+        divisors = factor * pre + rec
+        f = np.where(divisors > 0,
+                     (1 + factor) * pre * rec / divisors, 0)
+    # summed order by order, as in apply_ngram_weights
+    result = []
+    for values in (pre, rec, f):
+        total = 0
+        for (i, w) in enumerate(ngram_weights):
+            total = total + w * values[..., i]
+        result.append(total)
+    return tuple(result)
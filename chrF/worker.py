@@ -0,0 +1,68 @@
+# -*- coding: utf-8
+"""Resident scoring worker for tuning toolkits.
+
+Instead of starting the command line tool once per sentence,
+a tuner starts it once with --server-stdin and writes one request
+per line to its stdin:
+
+  hypothesis<TAB>reference 1*#reference 2
+
+For each request, one line is written to stdout and flushed at once:
+either the sentence chrF, or with --raw-counts the sufficient statistics
+(the hyp_err, hyp_len, ref_err and ref_len counts of each n-gram order,
+in the order of the --emit-stats records), which can be summed for
+corpus level scores.
+
+A malformed request is answered with a line starting with "ERROR",
+and the worker goes on with the next request.
+"""
+import sys
+
+from .measure import evaluate_single, apply_ngram_weights, normalize_weights
+from .statsfile import FIELDS
+
+
+def parse_request(line, refsep='*#'):
+    """(hypothesis, references) of a request line"""
+    line = line.rstrip('\r\n')
+    if '\t' not in line:
+        raise ValueError(
+            'Expected "hypothesis<TAB>references", got {!r}'.format(line))
+    hypothesis, references = line.split('\t', 1)
+    return (hypothesis.strip(), references.strip().split(refsep))
+
+
+def format_counts(stats):
+    return ' '.join(str(int(x))
+                    for field in FIELDS
+                    for x in getattr(stats, field))
+
+
+def format_score(stats, factor, ngram_weights):
+    pres, recs, fs = stats.ngram_prf(factor)
+    _, _, f = apply_ngram_weights(pres, recs, fs, ngram_weights)
+    return '{:.4f}'.format(f)
+
+
+def serve_stdin(max_n, beta=1.0, ngram_weights=None, use_space=True,
+                refsep='*#', raw_counts=False, instream=None, outstream=None):
+    """Answers request lines until the end of instream"""
+    instream = sys.stdin if instream is None else instream
+    outstream = sys.stdout if outstream is None else outstream
+    factor = beta ** 2
+    ngram_weights = normalize_weights(ngram_weights, max_n)
+    # readline rather than iteration, which may wait for more input
+    for line in iter(instream.readline, ''):
+        try:
+            hypothesis, references = parse_request(line, refsep=refsep)
+        except ValueError as exc:
+            outstream.write('ERROR {}\n'.format(exc))
+            outstream.flush()
+            continue
+        stats = evaluate_single(hypothesis, references, max_n, factor,
+                                use_space=use_space, missing=False)
+        if raw_counts:
+            outstream.write(format_counts(stats) + '\n')
+        else:
+            outstream.write(format_score(stats, factor, ngram_weights) + '\n')
+        outstream.flush()
@@ -17,7 +17,7 @@ setup(name='chrF',
       author_email='stig-arne.gronroos@aalto.fi',
       #url='',
       description='chrF',
-      packages=['chrF'], #, 'chrF.tests'],
+      packages=['chrF', 'chrF.tests'],
       classifiers=[
           'Development Status :: 4 - Beta',
           'Intended Audience :: Science/Research',
@@ -31,6 +31,9 @@ setup(name='chrF',
                'scripts/chrF_sgm',
               ],
       #install_requires=requires,
+      extras_require={
+          'numpy': ['numpy'],
+      },
       #extras_require={
       #    'docs': [l.strip() for l in open('docs/build_requirements.txt')]
       #}